@@ -360,7 +360,25 @@ class I3D(models.VideoModel):
         return self.base_model(x)
 
     def get_augmentation(self, modality):
-        if modality == 'RGB':
+        if modality == 'RGB' and self.model_config.get("tensor_transforms", False):
+            # same pipelines, on the whole clip as an uint8 tensor (T, H, W, C) instead of frame by frame
+            train_augmentation = torchvision.transforms.Compose(
+                [ClipFromGroup(),
+                 ClipMultiScaleCrop(self.model_config.resolution, [1, .875, .75]),
+                 ClipRandomHorizontalFlip(is_flow=False),
+                 ClipStack(roll=False),
+                 ToTorchFormatTensor(div=not self.model_config.normalize),
+                 GroupNormalize(self.model_config.normalize, self.input_mean, self.input_std, self.range)]
+            )
+
+            val_augmentation = torchvision.transforms.Compose([
+                ClipFromGroup(),
+                ClipCenterCrop(self.model_config.resolution),
+                ClipStack(roll=False),
+                ToTorchFormatTensor(div=not self.model_config.normalize),
+                GroupNormalize(self.model_config.normalize, self.input_mean, self.input_std, self.range)
+            ])
+        elif modality == 'RGB':
             train_augmentation = torchvision.transforms.Compose(
                 # Data augmentation, at first reduce then interpolate
                 [GroupMultiScaleCrop(self.model_config.resolution, [1, .875, .75]),
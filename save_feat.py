@@ -4,6 +4,7 @@ import torch.nn.parallel
 import torch.optim
 import torch
 from utils.loaders import EpicKitchensDataset
+from utils.feature_store import FeatureStoreWriter
 from utils.args import args
 from utils.utils import pformat_dict
 import utils
@@ -62,20 +63,43 @@ def main():
     if args.action == "save":
         augmentations = {"train": train_augmentations, "test": test_augmentations}
         # the only action possible with this script is "save"
-        loader = torch.utils.data.DataLoader(EpicKitchensDataset(args.dataset.shift.split("-")[1], modalities,
-                                                                 args.split, args.dataset,
-                                                                 args.save.num_frames_per_clip,
-                                                                 args.save.num_clips, args.save.dense_sampling,
-                                                                 augmentations[args.split], additional_info=True,
-                                                                 **{"save": args.split}),
-                                             batch_size=1, shuffle=False,
+        dataset = EpicKitchensDataset(args.dataset.shift.split("-")[1], modalities, args.split, args.dataset,
+                                      args.save.num_frames_per_clip, args.save.num_clips, args.save.dense_sampling,
+                                      augmentations[args.split], additional_info=True, **{"save": args.split})
+
+        # uint8 clips from the workers, augmented batch by batch in this process (dataset.batch_augmentation)
+        augment_batch = dataset.augment_batch
+
+        writer = None
+        if args.save.get("format", "pkl") == "store" and args.split == "train":
+            # aggregate_features only reads the pickles, the train features would be left per clip
+            raise ValueError("save.format: store is not supported for the train split, the temporal aggregation "
+                             "of the features requires save.format: pkl")
+        if args.save.get("format", "pkl") == "store":
+            # features are streamed to disk every flush_every samples instead of being kept in memory
+            writer = FeatureStoreWriter(get_features_path(), modalities, flush_every=args.save.get("flush_every", 256),
+                                        resume=args.save.get("resume", False))
+            if len(writer.written_uids) > 0:
+                logger.info(f"Resuming feature extraction: {len(writer.written_uids)} samples already saved")
+                dataset = torch.utils.data.Subset(dataset, [i for i, record in enumerate(dataset.video_list)
+                                                            if int(record.uid) not in writer.written_uids])
+                if len(dataset) == 0:
+                    logger.info("All the samples are already saved, nothing left to extract")
+                    writer.close()
+                    return
+
+        loader = torch.utils.data.DataLoader(dataset, batch_size=args.save.get("batch_size", 1), shuffle=False,
                                              num_workers=args.dataset.workers, pin_memory=True, drop_last=False)
-        save_feat(action_classifier, loader, device, action_classifier.current_iter, num_classes)
+        save_feat(action_classifier, loader, device, action_classifier.current_iter, num_classes, writer, augment_batch)
     else:
         raise NotImplementedError
 
 
-def save_feat(model, loader, device, it, num_classes):
+def get_features_path():
+    return os.path.join("saved_features", args.name + "_" + args.dataset.shift.split("-")[1] + "_" + args.split)
+
+
+def save_feat(model, loader, device, it, num_classes, writer=None, augment_batch=None):
     """
     function to validate the model on the test set
     model: Task containing the model to be tested
@@ -83,6 +107,8 @@ def save_feat(model, loader, device, it, num_classes):
     device: device on which you want to test
     it: int, iteration among the training num_iter at which the model is tested
     num_classes: int, number of classes in the classification problem
+    writer: FeatureStoreWriter the features are streamed to, if None they are pickled at the end
+    augment_batch: function applied to the data of each batch before the forward, e.g. EpicKitchensDataset.augment_batch
     """
     global modalities
 
@@ -96,53 +122,57 @@ def save_feat(model, loader, device, it, num_classes):
     with torch.no_grad():
         for i_val, (data, label, video_name, uid) in enumerate(loader):
             label = label.to(device)
+            if augment_batch is not None:
+                data = augment_batch(data)
 
+            clip = {}
             for m in modalities:
                 batch, _, height, width = data[m].shape
                 # logger.info(f"Data shape: {data[m].shape}") # -> torch.Size([1, 75, 224, 224])
                 data[m] = data[m].reshape(batch, args.save.num_clips,
                                           args.save.num_frames_per_clip[m], -1, height, width)
                 data[m] = data[m].permute(1, 0, 3, 2, 4, 5)
+                # all the clips of all the samples in the batch go through a single forward:
+                # (num_clips, batch, C, T, H, W) -> (num_clips * batch, C, T, H, W)
+                clip[m] = data[m].reshape(args.save.num_clips * batch, *data[m].shape[2:]).to(device)
 
-                logits[m] = torch.zeros((args.save.num_clips, batch, num_classes)).to(device)
-                features[m] = torch.zeros((args.save.num_clips, batch, model.task_models[m]
-                                           .module.feat_dim)).to(device)
-
-            clip = {}
-            for i_c in range(args.save.num_clips):
-                for m in modalities:
-                    clip[m] = data[m][i_c].to(device)
-
-                output, feat = model(clip) # forward
-                feat = feat["features"]
-                for m in modalities:
-                    logits[m][i_c] = output[m]
-                    features[m][i_c] = feat[m]
+            output, feat = model(clip) # forward
+            feat = feat["features"]
+            for m in modalities:
+                logits[m] = output[m].reshape(args.save.num_clips, batch, num_classes)
+                features[m] = feat[m].reshape(args.save.num_clips, batch, model.task_models[m].module.feat_dim)
 
             # logger.info(f"Features shape: {np.array(features['RGB'].cpu()).shape}") # -> (5, 1, 1024)
             for m in modalities:
                 logits[m] = torch.mean(logits[m], dim=0)
                 
+            batch_features = {m: features[m].cpu().detach().numpy() for m in modalities}
             for i in range(batch):
-                sample = {"uid": int(uid[i].cpu().detach().numpy()), "video_name": video_name[i]}
+                sample = {"uid": int(uid[i].cpu().detach().numpy()), "video_name": video_name[i],
+                          "label": int(label[i].cpu().detach().numpy())}
                 for m in modalities:
-                    sample["features_" + m] = features[m][:, i].cpu().detach().numpy()
-                results_dict["features"].append(sample)
+                    sample["features_" + m] = batch_features[m][:, i].copy()
+                if writer is not None:
+                    writer.append([sample])
+                else:
+                    results_dict["features"].append(sample)
             num_samples += batch
 
             model.compute_accuracy(logits, label)
 
-            if (i_val + 1) % (len(loader) // 5) == 0:
+            if (i_val + 1) % max(len(loader) // 5, 1) == 0:
                 logger.info("[{}/{}] top1= {:.3f}% top5 = {:.3f}%".format(i_val + 1, len(loader),
                                                                           model.accuracy.avg[1], model.accuracy.avg[5]))
 
-        os.makedirs("saved_features", exist_ok=True)
-        pickle.dump(results_dict, open(os.path.join("saved_features", args.name + "_" +
-                                                    args.dataset.shift.split("-")[1] + "_" +
-                                                    args.split + ".pkl"), 'wb'))
+        if writer is not None:
+            # columnar store, memory-mapped by the loaders (see utils/feature_store.py)
+            writer.close()
+        else:
+            os.makedirs("saved_features", exist_ok=True)
+            pickle.dump(results_dict, open(get_features_path() + ".pkl", 'wb'))
 
-        if (args.split == "train"):
-            aggregate_features(args.split) # Temporary aggregation of features
+            if (args.split == "train"):
+                aggregate_features(args.split) # Temporary aggregation of features
 
         class_accuracies = [(x / y) * 100 for x, y in zip(model.accuracy.correct, model.accuracy.total)]
         logger.info('Final accuracy: top1 = %.2f%%\ttop5 = %.2f%%' % (model.accuracy.avg[1],
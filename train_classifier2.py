@@ -84,16 +84,18 @@ def main():
         # notice, here it is multiplied by tot_batch/batch_size since gradient accumulation technique is adopted
         training_iterations = args.train.num_iter * (args.total_batch // args.batch_size)
         # all dataloaders are generated here
+        train_dataset = ActionEMGDataset(args.dataset.shift.split("-")[0], 'train', args.dataset)
         train_loader = torch.utils.data.DataLoader(
-                ActionEMGDataset(args.dataset.shift.split("-")[0], 'train', args.dataset),
+                train_dataset,
                 batch_size=args.batch_size, shuffle=False, num_workers=args.dataset.workers,
-                pin_memory=True, drop_last=True
+                pin_memory=True, drop_last=True, collate_fn=train_dataset.collate_fn
             )
 
+        val_dataset = ActionEMGDataset(args.dataset.shift.split("-")[0], 'val', args.dataset)
         val_loader = torch.utils.data.DataLoader(
-                ActionEMGDataset(args.dataset.shift.split("-")[0], 'val', args.dataset),
+                val_dataset,
                 batch_size=args.batch_size, shuffle=False, num_workers=args.dataset.workers,
-                pin_memory=True, drop_last=False
+                pin_memory=True, drop_last=False, collate_fn=val_dataset.collate_fn
             )
         
         train(action_classifier, train_loader, val_loader, device, num_classes)
@@ -84,22 +84,28 @@ def main():
         # notice, here it is multiplied by tot_batch/batch_size since gradient accumulation technique is adopted
         training_iterations = args.train.num_iter * (args.total_batch // args.batch_size)
         # all dataloaders are generated here
-        train_loader = torch.utils.data.DataLoader(ActionNetDataset('train', args.dataset),
+        train_dataset = ActionNetDataset('train', args.dataset)
+        train_loader = torch.utils.data.DataLoader(train_dataset,
                                                    batch_size=args.batch_size, shuffle=True,
-                                                   num_workers=args.dataset.workers, pin_memory=True, drop_last=True)
+                                                   num_workers=args.dataset.workers, pin_memory=True, drop_last=True,
+                                                   collate_fn=train_dataset.collate_fn)
 
-        val_loader = torch.utils.data.DataLoader(ActionNetDataset('val', args.dataset),
+        val_dataset = ActionNetDataset('val', args.dataset)
+        val_loader = torch.utils.data.DataLoader(val_dataset,
                                                    batch_size=args.batch_size, shuffle=True,
-                                                   num_workers=args.dataset.workers, pin_memory=True, drop_last=False)
+                                                   num_workers=args.dataset.workers, pin_memory=True, drop_last=False,
+                                                   collate_fn=val_dataset.collate_fn)
         
         train(action_classifier, train_loader, val_loader, device, num_classes)
 
     elif args.action == "validate":
         if args.resume_from is not None:
             action_classifier.load_last_model(args.resume_from)
-        val_loader = torch.utils.data.DataLoader(ActionNetDataset('val', args.dataset),
+        val_dataset = ActionNetDataset('val', args.dataset)
+        val_loader = torch.utils.data.DataLoader(val_dataset,
                                                    batch_size=args.batch_size, shuffle=True,
-                                                   num_workers=args.dataset.workers, pin_memory=True, drop_last=False)
+                                                   num_workers=args.dataset.workers, pin_memory=True, drop_last=False,
+                                                   collate_fn=val_dataset.collate_fn)
 
         validate(action_classifier, val_loader, device, action_classifier.current_iter, num_classes)
 
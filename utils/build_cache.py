@@ -0,0 +1,92 @@
+"""
+Incremental build cache of the ActionNet datasets.
+
+The builders of dataset_creator split the work into per-recording stages (e.g. windows -> spectrogram). The output
+of a stage is stored under <root>/<stage>/<key>.pkl, where key is a fingerprint of:
+    - the content of the input files (sha256, memoized by path, size and mtime in <root>/file_hashes.json)
+    - the parameters the stage depends on (fps, offset, filter order, cutoff, n_fft, hop_length, ...)
+    - the keys of the stages it is computed from
+so a rebuild only recomputes the stages of the recordings whose inputs or parameters changed, and a change of the
+spectrogram parameters reuses the cached windows.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+
+HASHES_NAME = "file_hashes.json"
+
+
+class BuildCache(object):
+
+    def __init__(self, root="action-net/build_cache"):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.root, exist_ok=True)
+
+        self._hashes_path = os.path.join(self.root, HASHES_NAME)
+        self._hashes = {}
+        if os.path.isfile(self._hashes_path):
+            with open(self._hashes_path, "r") as f:
+                self._hashes = json.load(f)
+
+    def file_hash(self, path):
+        # content hash of path, recomputed only when its size or modification time changes
+        stat = os.stat(path)
+        entry = self._hashes.get(os.path.abspath(path))
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha256"]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        self._hashes[os.path.abspath(path)] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                               "sha256": digest.hexdigest()}
+        self._save_hashes()
+        return digest.hexdigest()
+
+    def _save_hashes(self):
+        tmp_path = self._hashes_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._hashes, f, indent=1)
+        os.replace(tmp_path, self._hashes_path)
+
+    def key(self, stage, files=(), params=None, parents=()):
+        """
+        stage: str, name of the stage
+        files: list of input files, fingerprinted by content
+        params: dict (json serializable) of the parameters of the stage
+        parents: keys of the stages the input of this stage comes from
+        """
+        fingerprint = {"stage": stage,
+                       "files": [self.file_hash(f) for f in files],
+                       "params": params or {},
+                       "parents": list(parents)}
+        return hashlib.sha256(json.dumps(fingerprint, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _path(self, stage, key):
+        return os.path.join(self.root, stage, key + ".pkl")
+
+    def get_or_compute(self, stage, key, compute):
+        # returns the cached output of stage for key, or calls compute() and caches its output
+        path = self._path(stage, key)
+        if os.path.isfile(path):
+            self.hits += 1
+            with open(path, "rb") as f:
+                return pickle.load(f)
+
+        self.misses += 1
+        output = compute()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write-then-rename, an interrupted build never leaves a truncated entry behind
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        return output
+
+    def report(self, name):
+        print(f"{name}: {self.hits} stages reused from {self.root}, {self.misses} recomputed")
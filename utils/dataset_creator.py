@@ -1,14 +1,19 @@
-import random
 import pickle
+import itertools
 import statistics
 import os
 import pandas as pd
 import numpy as np
+import torch
+import utils.emg_preprocessing as emg_preprocessing
+import utils.spec_emg as spec_emg
+from utils.build_cache import BuildCache
 from utils.extract_pkl import *
 from sklearn.model_selection import train_test_split
-from scipy.signal import butter, filtfilt
-import torch
 from utils.spec_emg import compute_spectrogram
+from utils.emg_preprocessing import preprocess
+from utils.resampling import resample_windows, strided_indices
+from utils.utils import make_uid, recording_name
 
 
 label_dict = {
@@ -38,6 +43,8 @@ label_dict = {
 
 fps = 30
 offset = 5  # seconds
+window_length = 750  # rows of each EMG window
+resampling_mode = "strided"  # strided, linear or polyphase, see utils/resampling.py
 labels = [
     "Spread jelly on a bread slice",
     "Slice a potato",
@@ -96,7 +103,6 @@ labels_remapping = {
     ),
 }
 
-uid = random.randint(0, 20000)
 dataset = []
 dataset_reduced = []
 dataset_emg = []
@@ -104,9 +110,9 @@ timestamps = []
 timestamps_int = []
 
 
-def generate_record(index, row, first_frame, cnt=1, emg=False):
+def generate_record(recording, index, row, first_frame, cnt=1, emg=False):
     record = {}
-    record["uid"] = uid + index
+    record["uid"] = make_uid(recording, index)
     record["participant_id"] = "P04"
     record["video_id"] = f"P04_0{cnt}"
     if not emg:
@@ -132,7 +138,7 @@ def generate_record(index, row, first_frame, cnt=1, emg=False):
     return record
 
 
-def dataset_augmentation(record, uid):
+def dataset_augmentation(record, recording, index):
     duration = int(record["stop_timestamp"] - record["start_timestamp"])
     if duration < (offset * 2):
         return [record]
@@ -144,7 +150,7 @@ def dataset_augmentation(record, uid):
         first_iteration = False
         new_record = record.copy()
 
-        new_record["uid"] = uid
+        new_record["uid"] = make_uid(recording, index, len(records))
         new_record["start_timestamp"] = new_record["start_timestamp"] + next
         new_record["stop_timestamp"] = new_record["start_timestamp"] + offset
 
@@ -154,33 +160,44 @@ def dataset_augmentation(record, uid):
         new_record["stop_frame"] = new_record["start_frame"] + (fps * offset)
 
         next += offset + 1
-        uid += 1
         if duration - next < offset:
             new_record["stop_timestamp"] = record["stop_timestamp"]
             new_record["stop_frame"] = record["stop_frame"]
 
-        readings = []
-        for i in range(len(new_record["myo_left_timestamps"])):
-            ts = new_record["myo_left_timestamps"][i]
-            if int(ts) >= int(new_record["start_timestamp"]) and int(ts) <= int(
-                new_record["stop_timestamp"]
-            ):
-                readings.append(new_record["myo_left_readings"][i])
-        new_record["myo_left_readings"] = readings
-
-        readings = []
-        for i in range(len(new_record["myo_right_timestamps"])):
-            ts = new_record["myo_right_timestamps"][i]
-            if int(ts) >= int(new_record["start_timestamp"]) and int(ts) <= int(
-                new_record["stop_timestamp"]
-            ):
-                readings.append(new_record["myo_right_readings"][i])
-        new_record["myo_right_readings"] = readings
         records.append(new_record)
 
+    # the readings of all the sub-windows are cut at once
+    starts = [r["start_timestamp"] for r in records]
+    stops = [r["stop_timestamp"] for r in records]
+    for arm in ["left", "right"]:
+        readings = np.asarray(record[f"myo_{arm}_readings"])
+        windows = window_indexers(record[f"myo_{arm}_timestamps"], starts, stops)
+        for new_record, window in zip(records, windows):
+            new_record[f"myo_{arm}_readings"] = readings[window]
+
     return records
 
 
+def window_indexers(timestamps, starts, stops):
+    """
+    For each window returns the indexer of the readings whose timestamp, truncated to the second,
+    is in [int(start), int(stop)]. Timestamps are normally sorted: the bounds of all the windows are then found
+    by binary search and the indexers are slices, i.e. the readings are cut without copies.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    # int(ts) >= int(start) <=> ts >= floor(start), int(ts) <= int(stop) <=> ts < floor(stop) + 1
+    lower = np.floor(np.asarray(starts, dtype=np.float64))
+    upper = np.floor(np.asarray(stops, dtype=np.float64)) + 1
+
+    if np.any(timestamps[1:] < timestamps[:-1]):
+        # unsorted timestamps, the matching rows may not be contiguous
+        return [np.nonzero((timestamps >= lo) & (timestamps < up))[0] for lo, up in zip(lower, upper)]
+
+    begins = np.searchsorted(timestamps, lower, side="left")
+    ends = np.maximum(np.searchsorted(timestamps, upper, side="left"), begins)
+    return [slice(begin, end) for begin, end in zip(begins.tolist(), ends.tolist())]
+
+
 def remap_labels(record):
     record_reduced = record.copy()
     record_reduced["verb_class"] = labels_remapping[record["verb"]][0]
@@ -189,63 +206,151 @@ def remap_labels(record):
 
 
 def sampling(readings):
-    for i in range(2, 11):
-        value = 750 * (10 / i)
-        if len(readings) >= value:
-            r_cp = []
-            for k in range(0, int(value), 10):
-                r_cp.extend(readings[k : k + i])
-            return r_cp[:750]
+    return list(np.asarray(readings)[strided_indices(len(readings), window_length)])
+
+
+def fix_length(readings_list):
+    # windows (time, 8) -> array (len(readings_list), window_length, 8): longer windows are downsampled,
+    # shorter ones are padded with zero rows
+    return resample_windows(readings_list, length=window_length, mode=resampling_mode)
+
+
+def row_windows(file_pkl, recording, index, label):
+    # augment -> resample/pad of one row of a subject recording, returns its EMG windows
+    row = file_pkl.loc[index]
+    first_frame = float(file_pkl.loc[0]["start"])
+    record = generate_record(recording, index, row, first_frame, 1, True)
+
+    records = dataset_augmentation(record, recording, index)
+    right_readings = fix_length([r["myo_right_readings"] for r in records])
+    left_readings = fix_length([r["myo_left_readings"] for r in records])
+    return [
+        {
+            "id": r["uid"],
+            "right_readings": right_readings[k],
+            "left_readings": left_readings[k],
+            "label": label_dict[label],
+        }
+        for k, r in enumerate(records)
+    ]
+
+
+def build_params(stage):
+    # parameters each stage of the builders depends on, part of the fingerprints of the build cache
+    if stage == "spectrogram":
+        return {
+            "order": emg_preprocessing.ORDER,
+            "f_cutoff": emg_preprocessing.F_CUTOFF,
+            "fs": emg_preprocessing.FS,
+            "n_fft": spec_emg.N_FFT,
+            "hop_length": spec_emg.HOP_LENGTH,
+        }
+    return {"fps": fps, "offset": offset, "window_length": window_length, "resampling_mode": resampling_mode}
+
+
+def split_recordings(actionNet_train):
+    # rows of an ActionNet split grouped by recording file: {file: [(position in the split, index, label)]}
+    shards = {}
+    for i in range(len(actionNet_train)):
+        shards.setdefault(actionNet_train.iloc[i].file, []).append(
+            (i, actionNet_train.index[i], actionNet_train.iloc[i].description)
+        )
+    return shards
+
+
+def recording_spectrograms(windows):
+    # spectrograms (numpy) of the preprocessed readings of a list of windows, one batched call per arm
+    if len(windows) == 0:
+        return []
+    spect = {
+        arm: compute_spectrogram(preprocess(np.stack([w[f"{arm}_readings"] for w in windows]))).numpy()
+        for arm in ["right", "left"]
+    }
+    # each window gets its own copy: a view would keep the whole batch alive and, once wrapped in a torch tensor,
+    # pickle.dump could write the storage of the whole batch again for every window
+    return [
+        {
+            "id": w["id"],
+            "right_readings": spect["right"][k].copy(),
+            "left_readings": spect["left"][k].copy(),
+            "label": w["label"],
+        }
+        for k, w in enumerate(windows)
+    ]
+
+
+def cached_emg_windows(actionNet_train, cache, spectrogram=False):
+    """
+    Same windows as emg_windows (spectrogram=False), or their spectrograms as numpy arrays (spectrogram=True),
+    built recording by recording through a BuildCache: the windows of a recording are recomputed only when the
+    recording, its rows in the split or build_params("windows") change, its spectrograms only when the windows
+    or build_params("spectrogram") change.
+    """
+    rows = [[] for _ in range(len(actionNet_train))]
+    recordings = RecordingCache()
+
+    for file, file_rows in split_recordings(actionNet_train).items():
+        pkl_file = "action-net/pickles/" + file.strip(".pkl")
+        recording = recording_name(file)
+
+        def windows_stage():
+            # the recording is only read when the stage has to be recomputed
+            file_pkl = recordings.get(pkl_file)
+            return [row_windows(file_pkl, recording, index, label) for _, index, label in file_rows]
+
+        params = dict(build_params("windows"), rows=[[int(index), label] for _, index, label in file_rows])
+        key = cache.key("windows", [pkl_file + ".pkl"], params)
+        recording_rows = cache.get_or_compute("windows", key, windows_stage)
+
+        if spectrogram:
+            spect_key = cache.key("spectrogram", params=build_params("spectrogram"), parents=[key])
+            spect = cache.get_or_compute(
+                "spectrogram", spect_key, lambda: recording_spectrograms([w for row in recording_rows for w in row])
+            )
+            bounds = np.cumsum([0] + [len(row) for row in recording_rows])
+            recording_rows = [spect[bounds[j]:bounds[j + 1]] for j in range(len(recording_rows))]
 
+        for (position, _, _), windows in zip(file_rows, recording_rows):
+            rows[position] = windows
+
+    cache.report("EMG Action Net build cache")
+    return [w for windows in rows for w in windows]
 
-def emg_dataset(path, out_path):
-    actionNet_train = get_data_from_pkl_pd(path)
-    data = {"features": []}
-    dataset_emg = []
-    uid_offset = 0
-    first_frame = 0
+
+def emg_windows(actionNet_train):
+    """
+    Pipeline read row -> augment -> resample/pad over the rows of an ActionNet split (e.g. ActionNet_train):
+    yields the EMG windows one by one, each of them processed exactly once.
+    """
+    # see RecordingCache
+    recordings = RecordingCache()
 
     for i in range(len(actionNet_train)):
         index = actionNet_train.index[i]
         file = actionNet_train.iloc[i].file
         label = actionNet_train.iloc[i].description
 
-        file_pkl = get_data_from_pkl_pd("action-net/pickles/" + file.strip(".pkl"))
-        row = file_pkl.loc[index]
-        first_frame = float(file_pkl.loc[0]["start"])
-        record = generate_record(uid_offset, row, first_frame, 1, True)
+        file_pkl = recordings.get("action-net/pickles/" + file.strip(".pkl"))
+        yield from row_windows(file_pkl, recording_name(file), index, label)
 
-        records = dataset_augmentation(record, uid_offset)
-        uid_offset += len(records)
-        for r in records:
-            dataset_emg.append(
-                {
-                    "id": r["uid"],
-                    "right_readings": r["myo_right_readings"],
-                    "left_readings": r["myo_left_readings"],
-                    "label": label_dict[label],
-                }
-            )
 
-        for i in range(len(dataset_emg)):
-            readings = dataset_emg[i]["right_readings"]
-            if len(readings) > 750:
-                readings = sampling(readings)
-            elif len(readings) < 750:
-                new_rows = np.zeros((750 - len(readings), 8))
-                readings = np.concatenate((readings, new_rows), axis=0)
-            dataset_emg[i]["right_readings"] = readings
-
-        for i in range(len(dataset_emg)):
-            readings = dataset_emg[i]["left_readings"]
-            if len(readings) > 750:
-                readings = sampling(readings)
-            elif len(readings) < 750:
-                new_rows = np.zeros((750 - len(readings), 8))
-                readings = np.concatenate((readings, new_rows), axis=0)
-            dataset_emg[i]["left_readings"] = readings
-
-    data["features"] = dataset_emg
+def batches(iterable, batch_size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if len(batch) == 0:
+            return
+        yield batch
+
+
+def emg_dataset(path, out_path, cache_dir=None):
+    # cache_dir: folder of the BuildCache, None to build everything from scratch
+    actionNet_train = get_data_from_pkl_pd(path)
+    if cache_dir is not None:
+        data = {"features": cached_emg_windows(actionNet_train, BuildCache(cache_dir))}
+    else:
+        data = {"features": list(emg_windows(actionNet_train))}
+
     with open(out_path, "wb") as file:
         pickle.dump(data, file)
 
@@ -253,162 +358,72 @@ def emg_dataset(path, out_path):
     return data
 
 
-def preprocess(readings):
-    #* apply preprocessing to the EMG data
-
-    #* Rectification
-    # abs value
-    readings_rectified = np.abs(readings)
-    #* low-pass Filter
-    # Frequenza di campionamento (Hz)
-    fs = 160  # Frequenza dei sampling data da loro
-    f_cutoff = 5  # Frequenza di taglio
-
-    # Ordine del filtro
-    order = 4 
-    # Calcolo dei coefficienti del filtro
-    b, a = butter(order, f_cutoff / (fs / 2), btype='low')
-    # Concateno tutti i vettori in un'unica matrice
-    readings_filtered = np.zeros_like(readings_rectified, dtype=float)
-    for i in range(8):  # 8 colonne
-        readings_filtered[:, i] = filtfilt(b, a, readings_rectified[:, i])
-
-    #print(readings_rectified[:6], readings_rectified.shape)
-    #print(readings_filtered[:6], readings_filtered.shape)
-    # exit()
-
-    # convert to tensor
-    readings_filtered = torch.tensor(readings_filtered, dtype=torch.float32)
-    
-    min_val, _ = torch.min(readings_filtered, dim=1, keepdim=True)
-    max_val, _ = torch.max(readings_filtered, dim=1, keepdim=True)
-
-    g = max_val - min_val + 0.0001
+def emg_dataset_spettrogram(path, out_path, batch_size=256, cache_dir=None):
+    # cache_dir: folder of the BuildCache, None to build everything from scratch
+    actionNet_train = get_data_from_pkl_pd(path)
+    data = {"features": []}
 
-    # # Normalize the data to the range -1 to 1
-    normalized_data = 2 * (readings_filtered - min_val) / g - 1
+    if cache_dir is not None:
+        windows = cached_emg_windows(actionNet_train, BuildCache(cache_dir), spectrogram=True)
+    else:
+        # preprocessing and spectrograms of a whole batch of windows in one call per arm
+        windows = (
+            w for batch in batches(emg_windows(actionNet_train), batch_size) for w in recording_spectrograms(batch)
+        )
 
-    #print(normalized_data[:6], normalized_data.shape)
+    for w in windows:
+        w["right_readings"] = torch.from_numpy(w["right_readings"])
+        w["left_readings"] = torch.from_numpy(w["left_readings"])
+        data["features"].append(w)
+        if len(data["features"]) % batch_size == 0:
+            print(f"Spectogramm: {len(data['features'])} windows")
 
+    with open(out_path, "wb") as file:
+        pickle.dump(data, file)
 
-    return normalized_data
+    print("EMG_comv Action Net Creation: done")
+    return data
 
 
-def emg_dataset_spettrogram(path, out_path):
-    actionNet_train = get_data_from_pkl_pd(path)
-    data = {"features": []}
-    dataset_final = []
-    uid_offset = 0
+def recording_windows(file):
+    # EMG windows of all the activities of a subject recording
+    dataset_emg = []
+    print(file)
+    data = get_data_from_pkl_pd(file)
+    recording = recording_name(file)
     first_frame = 0
 
-    for i in range(len(actionNet_train)):
-        index = actionNet_train.index[i]
-        file = actionNet_train.iloc[i].file
-        label = actionNet_train.iloc[i].description
-        dataset_emg = []
-        dataset_spect = []
+    for index, row in data.iterrows():
+        if index == 0:
+            first_frame = float(row["start"])
+            continue
 
-        file_pkl = get_data_from_pkl_pd("action-net/pickles/" + file.strip(".pkl"))
-        row = file_pkl.loc[index]
-        first_frame = float(file_pkl.loc[0]["start"])
-        record = generate_record(uid_offset, row, first_frame, 1, True)
+        record = generate_record(recording, index, row, first_frame, 1)
 
-        records = dataset_augmentation(record, uid_offset)
-        uid_offset += len(records)
+        # Dataset augmentation by splitting video
+        records = dataset_augmentation(record, recording, index)
         for r in records:
             dataset_emg.append(
                 {
                     "id": r["uid"],
                     "right_readings": r["myo_right_readings"],
                     "left_readings": r["myo_left_readings"],
-                    "label": label_dict[label],
-                }
-            )
-
-        for k in range(len(dataset_emg)):
-            readings = dataset_emg[k]["right_readings"]
-            if len(readings) > 750:
-                readings = sampling(readings)
-            elif len(readings) < 750:
-                new_rows = np.zeros((750 - len(readings), 8))
-                readings = np.concatenate((readings, new_rows), axis=0)
-            dataset_emg[k]["right_readings"] = preprocess(readings)
-
-        for k in range(len(dataset_emg)):
-            readings = dataset_emg[k]["left_readings"]
-            if len(readings) > 750:
-                readings = sampling(readings)
-            elif len(readings) < 750:
-                new_rows = np.zeros((750 - len(readings), 8))
-                readings = np.concatenate((readings, new_rows), axis=0)
-            dataset_emg[k]["left_readings"] = preprocess(readings)
-
-        for k in range(len(dataset_emg)):
-            dataset_spect.append(
-                {
-                    "id": dataset_emg[k]["id"],
-                    "right_readings": compute_spectrogram(dataset_emg[k]["right_readings"]),
-                    "left_readings": compute_spectrogram(dataset_emg[k]["left_readings"]),
-                    "label": dataset_emg[k]["label"],
+                    "label": r["verb_class"],
                 }
             )
-        dataset_final.extend(dataset_spect)
 
-        print(f"Spectogramm: {i}/{len(actionNet_train)}")
-        
-    data["features"] = dataset_final
-    with open(out_path, "wb") as file:
-        pickle.dump(data, file)
-
-    print("EMG_comv Action Net Creation: done")
-    return data
+    right_readings = fix_length([r["right_readings"] for r in dataset_emg])
+    left_readings = fix_length([r["left_readings"] for r in dataset_emg])
+    for i in range(len(dataset_emg)):
+        dataset_emg[i]["right_readings"] = right_readings[i]
+        dataset_emg[i]["left_readings"] = left_readings[i]
+    return dataset_emg
 
 
 def emg_analysis(folder):
     dataset_emg = []
     for file in folder:
-        print(file)
-        data = get_data_from_pkl_pd(file)
-        uid_offset = 0
-        first_frame = 0
-
-        for index, row in data.iterrows():
-            if index == 0:
-                first_frame = float(row["start"])
-                continue
-
-            record = generate_record(uid_offset, row, first_frame, 1)
-
-            # Dataset augmentation by splitting video
-            records = dataset_augmentation(record, uid_offset)
-            uid_offset += len(records)
-            for r in records:
-                dataset_emg.append(
-                    {
-                        "id": r["uid"],
-                        "right_readings": r["myo_right_readings"],
-                        "left_readings": r["myo_left_readings"],
-                        "label": r["verb_class"],
-                    }
-                )
-
-    for i in range(len(dataset_emg)):
-        readings = dataset_emg[i]["right_readings"]
-        if len(readings) > 750:
-            readings = sampling(readings)
-        elif len(readings) < 750:
-            new_rows = np.zeros((750 - len(readings), 8))
-            readings = np.concatenate((readings, new_rows), axis=0)
-        dataset_emg[i]["right_readings"] = readings
-
-    for i in range(len(dataset_emg)):
-        readings = dataset_emg[i]["left_readings"]
-        if len(readings) > 750:
-            readings = sampling(readings)
-        elif len(readings) < 750:
-            new_rows = np.zeros((750 - len(readings), 8))
-            readings = np.concatenate((readings, new_rows), axis=0)
-        dataset_emg[i]["left_readings"] = readings
+        dataset_emg.extend(recording_windows(file))
 
     # Convert list of dictionaries to DataFrame
     df_emg = pd.DataFrame(dataset_emg)
@@ -417,22 +432,22 @@ def emg_analysis(folder):
     return df_emg
 
 
-def rgb_action_net_creation(out_path=None, out_path_reduced=None, out_path_emg=None):
-    data = get_data_from_pkl_pd("action-net/pickles/S04_1")
-    uid_offset = 0
+def recording_records(data, recording):
+    # rgb records, rgb records with reduced labels and fixed-length EMG windows of all the activities of a recording
+    dataset_rgb = []
+    dataset_rgb_reduced = []
+    dataset_rgb_emg = []
     first_frame = 0
-    dataset_spect = []
 
     for index, row in data.iterrows():
         if index == 0:
             first_frame = float(row["start"])
             continue
 
-        record = generate_record(uid_offset, row, first_frame, 1)
+        record = generate_record(recording, index, row, first_frame, 1)
 
         # Dataset augmentation by splitting video
-        records = dataset_augmentation(record, uid_offset)
-        uid_offset += len(records)
+        records = dataset_augmentation(record, recording, index)
         for r in records:
             # Adding record(s) to dataset
             r_rgb = {
@@ -448,9 +463,9 @@ def rgb_action_net_creation(out_path=None, out_path_reduced=None, out_path_emg=N
                 "stop_frame": r["stop_frame"],
             }
 
-            dataset.append(r_rgb)
+            dataset_rgb.append(r_rgb)
 
-            dataset_emg.append(
+            dataset_rgb_emg.append(
                 {
                     "id": r["uid"],
                     "right_readings": r["myo_right_readings"],
@@ -461,37 +476,43 @@ def rgb_action_net_creation(out_path=None, out_path_reduced=None, out_path_emg=N
 
             # Remap labels
             record_reduced = remap_labels(r_rgb)
-            dataset_reduced.append(record_reduced)
+            dataset_rgb_reduced.append(record_reduced)
 
     # EMG adjustments
-    for i in range(len(dataset_emg)):
-        readings = dataset_emg[i]["right_readings"]
-        if len(readings) > 750:
-            readings = sampling(readings)
-        elif len(readings) < 750:
-            new_rows = np.zeros((750 - len(readings), 8))
-            readings = np.concatenate((readings, new_rows), axis=0)
-        dataset_emg[i]["right_readings"] = preprocess(readings)
+    right_readings = fix_length([r["right_readings"] for r in dataset_rgb_emg])
+    left_readings = fix_length([r["left_readings"] for r in dataset_rgb_emg])
+    for i in range(len(dataset_rgb_emg)):
+        dataset_rgb_emg[i]["right_readings"] = right_readings[i]
+        dataset_rgb_emg[i]["left_readings"] = left_readings[i]
 
-    for i in range(len(dataset_emg)):
-        readings = dataset_emg[i]["left_readings"]
-        if len(readings) > 750:
-            readings = sampling(readings)
-        elif len(readings) < 750:
-            new_rows = np.zeros((750 - len(readings), 8))
-            readings = np.concatenate((readings, new_rows), axis=0)
-        dataset_emg[i]["left_readings"] = preprocess(readings)
-
-    for k in range(len(dataset_emg)):
-        print(f"Spectogramm: {k}/{len(dataset_emg)}")
-        dataset_spect.append(
-            {
-                "id": dataset_emg[k]["id"],
-                "right_readings": compute_spectrogram(dataset_emg[k]["right_readings"]),
-                "left_readings": compute_spectrogram(dataset_emg[k]["left_readings"]),
-                "label": dataset_emg[k]["label"],
-            }
-        )
+    return dataset_rgb, dataset_rgb_reduced, dataset_rgb_emg
+
+
+def rgb_action_net_creation(out_path=None, out_path_reduced=None, out_path_emg=None, cache_dir=None):
+    # cache_dir: folder of the BuildCache, None to build everything from scratch
+    recording_file = "action-net/pickles/S04_1"
+
+    def records_stage():
+        return recording_records(get_data_from_pkl_pd(recording_file), "S04_1")
+
+    if cache_dir is None:
+        records = records_stage()
+        spect = recording_spectrograms(records[2])
+    else:
+        cache = BuildCache(cache_dir)
+        key = cache.key("records", [recording_file + ".pkl"], build_params("records"))
+        records = cache.get_or_compute("records", key, records_stage)
+        spect_key = cache.key("spectrogram", params=build_params("spectrogram"), parents=[key])
+        spect = cache.get_or_compute("spectrogram", spect_key, lambda: recording_spectrograms(records[2]))
+        cache.report("RGB Action Net build cache")
+
+    dataset.extend(records[0])
+    dataset_reduced.extend(records[1])
+    dataset_emg.extend(records[2])
+    dataset_spect = [
+        dict(w, right_readings=torch.from_numpy(w["right_readings"]), left_readings=torch.from_numpy(w["left_readings"]))
+        for w in spect
+    ]
 
     # Convert list of dictionaries to DataFrame
     df_rgb = pd.DataFrame(dataset)
@@ -0,0 +1,58 @@
+from functools import lru_cache
+import numpy as np
+import torch
+from scipy.signal import butter, filtfilt
+
+# Frequenza di campionamento (Hz) dei dati Myo
+FS = 160
+# Frequenza di taglio del filtro passa-basso (Hz)
+F_CUTOFF = 5
+# Ordine del filtro
+ORDER = 4
+
+
+@lru_cache(maxsize=None)
+def get_filter_coefficients(order=ORDER, f_cutoff=F_CUTOFF, fs=FS):
+    # the Butterworth coefficients only depend on the parameters: computed once and reused
+    return butter(order, f_cutoff / (fs / 2), btype='low')
+
+
+def preprocess(readings, order=ORDER, f_cutoff=F_CUTOFF, fs=FS):
+    """
+    Rectification, low-pass filtering and normalization of EMG readings.
+    readings: array (..., time, channels), a single window or a whole batch of windows of the same length;
+        every channel of every window is filtered by a single filtfilt call along the time axis
+    returns a float32 torch.Tensor with the same shape, each row normalized to [-1, 1] across the channels
+    """
+    #* Rectification
+    readings_rectified = np.abs(np.asarray(readings, dtype=np.float64))
+
+    #* low-pass Filter
+    b, a = get_filter_coefficients(order, f_cutoff, fs)
+    readings_filtered = np.ascontiguousarray(filtfilt(b, a, readings_rectified, axis=-2))
+    readings_filtered = torch.tensor(readings_filtered, dtype=torch.float32)
+
+    #* Normalize the data to the range -1 to 1
+    min_val = torch.amin(readings_filtered, dim=-1, keepdim=True)
+    max_val = torch.amax(readings_filtered, dim=-1, keepdim=True)
+    g = max_val - min_val + 0.0001
+
+    return 2 * (readings_filtered - min_val) / g - 1
+
+
+def preprocess_records(records):
+    """
+    Preprocesses the left and right readings of a list of ActionEMGRecord in one batched call.
+    returns a tensor (num_records, 2, time, channels) with left readings in [:, 0] and right readings in [:, 1],
+        or None if the windows do not all have the same shape (they have to be preprocessed one by one)
+    """
+    if len(records) == 0:
+        return None
+    try:
+        readings = np.stack([np.stack((np.asarray(record.myo_left_readings), np.asarray(record.myo_right_readings)))
+                             for record in records])
+    except ValueError:
+        return None
+    if readings.dtype == object:
+        return None
+    return preprocess(readings)
@@ -24,10 +24,15 @@
 #
 ############
 
+import os
 import h5py
 import numpy as np
-from scipy import interpolate  # for the resampling example
+import pandas as pd
 import sys
+from utils.dataset_creator import dataset_augmentation, fix_length, label_dict
+from utils.emg_preprocessing import preprocess
+from utils.feature_store import FeatureStoreWriter
+from utils.utils import make_uid, recording_name
 
 # NOTE: HDFView is a helpful program for exploring HDF5 contents.
 #   The official download page is at https://www.hdfgroup.org/downloads/hdfview.
@@ -36,7 +41,13 @@ import sys
 
 class HDF5Extractor:
     def __init__(
-        self, in_path, out_folder=None, mode="sensor", device="myo-left", stream="emg"
+        self,
+        in_path,
+        out_folder=None,
+        mode="sensor",
+        device="myo-left",
+        stream="emg",
+        chunk_size=65536,
     ):
         self.in_path = in_path
         self.out_folder = out_folder
@@ -44,6 +55,8 @@ class HDF5Extractor:
         self.save = False
         self.device = device
         self.stream = stream
+        # rows read at a time by the streaming methods (iter_sensor_chunks, get_sensor_data_between)
+        self.chunk_size = chunk_size
         self.h5_file = h5py.File(in_path, "r")
 
     def extract_hdf5(self, save=False, label_index=0):
@@ -58,6 +71,8 @@ class HDF5Extractor:
                 self.extract_sensor_data_for_one_label(index=label_index)
             case "resample":
                 self.resample_sensor_data()
+            case "export":
+                self.export_windows()
 
     def get_sensor_data(self, device_name, stream_name):
         # Get the data as an Nx8 matrix where each row is a timestamp and each column is an EMG channel.
@@ -74,53 +89,217 @@ class HDF5Extractor:
 
         return emg_data, emg_time_s, emg_time_str
 
-    def get_activities_data(self, device_name, stream_name):
+    def iter_sensor_chunks(self, device_name, stream_name, chunk_size=None):
+        # Streams the data and the timestamps (seconds since epoch) in blocks of chunk_size rows,
+        #  only one block is in memory at a time.
+        chunk_size = chunk_size or self.chunk_size
+        data = self.h5_file[device_name][stream_name]["data"]
+        time_s = self.h5_file[device_name][stream_name]["time_s"]
+        for begin in range(0, len(time_s), chunk_size):
+            end = min(begin + chunk_size, len(time_s))
+            yield data[begin:end], np.reshape(time_s[begin:end], -1)
+
+    def _searchsorted(self, time_s, values, side="left"):
+        # np.searchsorted over the sorted time_s dataset, read chunk by chunk instead of loading it whole
+        values = np.asarray(values, dtype=np.float64)
+        positions = np.full(values.shape, len(time_s), dtype=np.int64)
+        unresolved = np.ones(values.shape, dtype=bool)
+        for begin in range(0, len(time_s), self.chunk_size):
+            chunk = np.reshape(time_s[begin:begin + self.chunk_size], -1)
+            # the values not resolved yet are greater than (left) / at least (right) every previous timestamp,
+            #  so if they fall inside this chunk their position in the chunk is their position in time_s
+            inside = unresolved & ((values <= chunk[-1]) if side == "left" else (values < chunk[-1]))
+            positions[inside] = begin + np.searchsorted(chunk, values[inside], side=side)
+            unresolved &= ~inside
+            if not unresolved.any():
+                break
+        return positions
+
+    def get_sensor_rows(self, device_name, stream_name, start_times_s, end_times_s):
+        # Row ranges [begin, end) of the samples with start <= time_s <= end, for each activity.
+        time_s = self.h5_file[device_name][stream_name]["time_s"]
+        begins = self._searchsorted(time_s, start_times_s, side="left")
+        ends = np.maximum(self._searchsorted(time_s, end_times_s, side="right"), begins)
+        return begins, ends
+
+    def get_sensor_data_between(
+        self, device_name, stream_name, start_times_s, end_times_s, with_time_str=False
+    ):
+        # Streaming version of get_sensor_data for a set of activities (e.g. the start/end times returned by
+        #  get_activities_data): only the rows of each activity are read from the file.
+        # Returns a list with (data, time_s) or (data, time_s, time_str) for each activity.
+        stream = self.h5_file[device_name][stream_name]
+        begins, ends = self.get_sensor_rows(
+            device_name, stream_name, start_times_s, end_times_s
+        )
+        segments = []
+        for begin, end in zip(begins.tolist(), ends.tolist()):
+            segment = (stream["data"][begin:end], np.reshape(stream["time_s"][begin:end], -1))
+            if with_time_str:
+                segment += (np.reshape(stream["time_str"][begin:end], -1),)
+            segments.append(segment)
+        return segments
+
+    def iter_resampled_chunks(
+        self, streams, reference=None, rate=None, extrapolate=True, chunk_size=None
+    ):
+        # Aligns several streams (e.g. [('myo-left', 'emg'), ('myo-right', 'emg'), ('myo-left', 'acceleration_g')])
+        #  onto a common time base with linear interpolation, one chunk of chunk_size target timestamps at a time.
+        # The common time base is the time_s of the reference (device_name, stream_name), or a uniform grid at
+        #  rate Hz over the interval covered by all the streams.
+        # Only the 1D time_s of each stream is read whole: for each chunk, each stream reads just the rows around
+        #  the chunk and interpolates all its channels with one vectorized gather.
+        # A stream without samples is NaN over the whole time base.
+        # Yields (time_s, {(device_name, stream_name): data}) for each chunk.
+        if (reference is None) == (rate is None):
+            raise ValueError("Either reference or rate must be given")
+        if rate is not None and rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        chunk_size = chunk_size or self.chunk_size
+        sources = {
+            (device_name, stream_name): (
+                self.h5_file[device_name][stream_name]["data"],
+                np.reshape(self.h5_file[device_name][stream_name]["time_s"][()], -1),
+            )
+            for device_name, stream_name in streams
+        }
+
+        if reference is not None:
+            time_s = np.reshape(self.h5_file[reference[0]][reference[1]]["time_s"][()], -1)
+        else:
+            ranges = [(t[0], t[-1]) for _, t in sources.values() if len(t) > 0]
+            if len(ranges) == 0:
+                raise ValueError(f"No samples in {list(streams)} to build a time base from")
+            start = max(first for first, _ in ranges)
+            stop = min(last for _, last in ranges)
+            time_s = start + np.arange(max(int(np.floor((stop - start) * rate)) + 1, 0)) / rate
+
+        for begin in range(0, len(time_s), chunk_size):
+            chunk_time_s = time_s[begin:begin + chunk_size]
+            resampled = {}
+            for name, (data, source_time_s) in sources.items():
+                if len(source_time_s) == 0:
+                    resampled[name] = np.full(
+                        (len(chunk_time_s), int(np.prod(data.shape[1:], dtype=np.int64))), np.nan
+                    )
+                    continue
+                # interpolation between the samples lower and lower + 1
+                lower = np.clip(
+                    np.searchsorted(source_time_s, chunk_time_s, side="right") - 1,
+                    0,
+                    max(len(source_time_s) - 2, 0),
+                )
+                upper = np.minimum(lower + 1, len(source_time_s) - 1)
+                first, last = int(lower[0]), int(upper[-1]) + 1
+                rows = np.reshape(data[first:last], (last - first, -1)).astype(np.float64)
+
+                gap = source_time_s[upper] - source_time_s[lower]
+                weights = np.divide(
+                    chunk_time_s - source_time_s[lower],
+                    gap,
+                    out=np.zeros_like(chunk_time_s),
+                    where=gap > 0,
+                )
+                if not extrapolate:
+                    # hold the first/last sample outside of the range of the stream
+                    weights = np.clip(weights, 0, 1)
+                weights = weights[:, None]
+                resampled[name] = (
+                    rows[lower - first] * (1 - weights) + rows[upper - first] * weights
+                )
+            yield chunk_time_s, resampled
+
+    def resample_streams(
+        self, streams, reference=None, rate=None, extrapolate=True, chunk_size=None
+    ):
+        # iter_resampled_chunks, concatenated: returns time_s (T,) and {(device_name, stream_name): (T, channels)}
+        chunks = list(
+            self.iter_resampled_chunks(streams, reference, rate, extrapolate, chunk_size)
+        )
+        time_s = np.concatenate([c[0] for c in chunks]) if chunks else np.empty(0)
+        resampled = {
+            name: np.concatenate([c[1][name] for c in chunks]) if chunks else np.empty((0, 0))
+            for name in streams
+        }
+        return time_s, resampled
+
+    def _parse_activity_events(self, device_name, stream_name, exclude_bad_labels=True):
         # Get the timestamped label data.
         # As described in the HDF5 metadata, each row has entries for ['Activity', 'Start/Stop', 'Valid', 'Notes'].
-        activity_datas = self.h5_file[device_name][stream_name]["data"]
-        activity_times_s = self.h5_file[device_name][stream_name]["time_s"]
-        # squeeze (optional) converts from a list of single-element lists to a 1D list
-        activity_times_s = np.squeeze(np.array(activity_times_s))
-        # Convert to strings for convenience.
-        activity_datas = [
-            [x.decode("utf-8") for x in datas] for datas in activity_datas
-        ]
+        activity_times_s = np.reshape(
+            self.h5_file[device_name][stream_name]["time_s"][()], -1
+        )
+        # Decode the whole (rows, 4) byte-string matrix at once.
+        if len(activity_times_s) == 0:
+            activity_datas = np.empty((0, 4), dtype=str)
+        else:
+            activity_datas = np.char.decode(
+                np.asarray(self.h5_file[device_name][stream_name]["data"][()], dtype=bytes),
+                "utf-8",
+            ).reshape(len(activity_times_s), -1)
 
         # Combine start/stop rows to single activity entries with start/stop times.
         #   Each row is either the start or stop of the label.
         #   The notes and ratings fields are the same for the start/stop rows of the label, so only need to check one.
 
         # some activities may have been marked as 'Bad' or 'Maybe' by the experimenter; submitted notes with the activity typically give more information
-        exclude_bad_labels = True
-        activities_labels = []
-        activities_start_times_s = []
-        activities_end_times_s = []
-        activities_ratings = []
-        activities_notes = []
-        for row_index, time_s in enumerate(activity_times_s):
-            label = activity_datas[row_index][0]
-            is_start = activity_datas[row_index][1] == "Start"
-            is_stop = activity_datas[row_index][1] == "Stop"
-            rating = activity_datas[row_index][2]
-            notes = activity_datas[row_index][3]
-            if exclude_bad_labels and rating in ["Bad", "Maybe"]:
-                continue
-            # Record the start of a new activity.
-            if is_start:
-                activities_labels.append(label)
-                activities_start_times_s.append(time_s)
-                activities_ratings.append(rating)
-                activities_notes.append(notes)
-            # Record the end of the previous activity.
-            if is_stop:
-                activities_end_times_s.append(time_s)
+        valid = np.ones(len(activity_times_s), dtype=bool)
+        if exclude_bad_labels:
+            valid = ~np.isin(activity_datas[:, 2], ["Bad", "Maybe"])
+        start_rows = np.flatnonzero(valid & (activity_datas[:, 1] == "Start"))
+        stop_rows = np.flatnonzero(valid & (activity_datas[:, 1] == "Stop"))
+
+        # Each stop ends the last start before it (if it has the same label), and each start keeps its first stop:
+        #  a missing or duplicated event only drops its own activity instead of shifting all the following ones.
+        owners = np.searchsorted(
+            activity_times_s[start_rows], activity_times_s[stop_rows], side="right"
+        ) - 1
+        matched = owners >= 0
+        matched[matched] = (
+            activity_datas[stop_rows[matched], 0] == activity_datas[start_rows[owners[matched]], 0]
+        )
+        owners, first_stop = np.unique(owners[matched], return_index=True)
+        start_rows, stop_rows = start_rows[owners], stop_rows[matched][first_stop]
+
+        unmatched = np.count_nonzero(valid & np.isin(activity_datas[:, 1], ["Start", "Stop"])) - 2 * len(owners)
+        if unmatched > 0:
+            print(f"{self.in_path}: {unmatched} unmatched start/stop events ignored")
 
         return (
-            activities_labels,
-            activities_start_times_s,
-            activities_end_times_s,
-            activities_ratings,
-            activities_notes,
+            activity_datas[start_rows, 0],
+            activity_times_s[start_rows],
+            activity_times_s[stop_rows],
+            activity_datas[start_rows, 2],
+            activity_datas[start_rows, 3],
+        )
+
+    def get_activities(self, device_name, stream_name, exclude_bad_labels=True):
+        # Activities as a structured array with fields label, start_s, end_s, rating, notes.
+        labels, start_times_s, end_times_s, ratings, notes = self._parse_activity_events(
+            device_name, stream_name, exclude_bad_labels
+        )
+        activities = np.zeros(
+            len(labels),
+            dtype=[
+                ("label", labels.dtype),
+                ("start_s", np.float64),
+                ("end_s", np.float64),
+                ("rating", ratings.dtype),
+                ("notes", notes.dtype),
+            ],
+        )
+        activities["label"] = labels
+        activities["start_s"] = start_times_s
+        activities["end_s"] = end_times_s
+        activities["rating"] = ratings
+        activities["notes"] = notes
+        return activities
+
+    def get_activities_data(self, device_name, stream_name):
+        # Same activities as get_activities, as separate lists.
+        return tuple(
+            events.tolist()
+            for events in self._parse_activity_events(device_name, stream_name)
         )
 
     def extract_sensor_data(self):
@@ -214,9 +393,6 @@ class HDF5Extractor:
         device_name = self.device  # e.g = 'experiment-activities'
         stream_name = self.stream  # e.g = 'activities'
 
-        emg_data, emg_time_s, emg_time_str = self.get_sensor_data(
-            self.device, self.stream
-        )
         activities_labels, activities_start_times_s, activities_end_times_s, _, _ = (
             self.get_activities_data(device_name, stream_name)
         )
@@ -242,13 +418,16 @@ class HDF5Extractor:
         label_start_time_s = label_start_times_s[target_label_instance]
         label_end_time_s = label_end_times_s[target_label_instance]
 
-        # Segment the data!
-        emg_indexes_forLabel = np.where(
-            (emg_time_s >= label_start_time_s) & (emg_time_s <= label_end_time_s)
-        )[0]
-        emg_data_forLabel = emg_data[emg_indexes_forLabel, :]
-        emg_time_s_forLabel = emg_time_s[emg_indexes_forLabel]
-        emg_time_str_forLabel = emg_time_str[emg_indexes_forLabel]
+        # Segment the data! Only the rows of the instance are read from the file.
+        emg_data_forLabel, emg_time_s_forLabel, emg_time_str_forLabel = (
+            self.get_sensor_data_between(
+                self.device,
+                self.stream,
+                [label_start_time_s],
+                [label_end_time_s],
+                with_time_str=True,
+            )[0]
+        )
 
         print(
             'EMG Data for Instance %d of Label "%s"'
@@ -315,17 +494,11 @@ class HDF5Extractor:
 
         # Resample the acceleration to match the EMG timestamps.
         #  Note that the IMU streamed at about 50 Hz while the EMG streamed at about 200 Hz.
-        fn_interpolate_acceleration = interpolate.interp1d(
-            acceleration_time_s,  # x values
-            acceleration_data,  # y values
-            axis=0,  # axis of the data along which to interpolate
-            kind="linear",  # interpolation method, such as 'linear', 'zero', 'nearest', 'quadratic', 'cubic', etc.
-            fill_value="extrapolate",  # how to handle x values outside the original range
-        )
-        acceleration_time_s_resampled = emg_time_s
-        acceleration_data_resampled = fn_interpolate_acceleration(
-            acceleration_time_s_resampled
+        #  Linear interpolation, extrapolated outside of the range of the acceleration timestamps.
+        acceleration_time_s_resampled, resampled = self.resample_streams(
+            [(device_name, stream_name)], reference=(self.device, self.stream)
         )
+        acceleration_data_resampled = resampled[(device_name, stream_name)]
 
         sampling_rate = (emg_data.shape[0] - 1) / (max(emg_time_s) - min(emg_time_s))
         sampling_rate_acc = (acceleration_data.shape[0] - 1) / (
@@ -363,3 +536,105 @@ class HDF5Extractor:
                 f"{self.out_folder}/acceleration_time_str_resampled.txt", "w"
             ) as txt_file:
                 txt_file.write(str(acceleration_time_str))
+
+    def export_windows(
+        self,
+        out_path=None,
+        activities_device="experiment-activities",
+        activities_stream="activities",
+        flush_every=256,
+    ):
+        ####################################################
+        # Direct HDF5 -> windowed EMG dataset export.
+        # Each labelled activity is cut into sub-windows as
+        #  dataset_creator does (dataset_augmentation),
+        #  resampled to a fixed length (fix_length) and
+        #  preprocessed (rectification, low-pass filter,
+        #  normalization) for both arms. The windows are
+        #  streamed to a feature store (utils/feature_store.py)
+        #  with modalities EMG_left and EMG_right, plus an
+        #  index.csv describing each window, without going
+        #  through the intermediate pickles.
+        # Export only: the loaders (ActionEMGDataset) still
+        #  read the split pickles of dataset_creator, the
+        #  store can be opened with FeatureStore.
+        ####################################################
+        print()
+        print("=" * 65)
+        print("Exporting windowed EMG data from the HDF5 file")
+        print("=" * 65)
+
+        if out_path is None:
+            if self.out_folder is None:
+                raise ValueError("export_windows needs out_path or an out_folder")
+            out_path = os.path.join(self.out_folder, "emg_windows")
+        recording = recording_name(self.in_path)
+        arms = ["left", "right"]
+
+        activities_labels, activities_start_times_s, activities_end_times_s, _, _ = (
+            self.get_activities_data(activities_device, activities_stream)
+        )
+        # Row ranges of all the activities, found once per arm.
+        rows = {
+            arm: self.get_sensor_rows(
+                f"myo-{arm}", "emg", activities_start_times_s, activities_end_times_s
+            )
+            for arm in arms
+        }
+
+        writer = FeatureStoreWriter(
+            out_path, ["EMG_" + arm for arm in arms], flush_every=flush_every
+        )
+        index = []
+        for i, label in enumerate(activities_labels):
+            if label not in label_dict:
+                continue
+
+            record = {
+                "uid": make_uid(recording, i),
+                "start_timestamp": float(activities_start_times_s[i]),
+                "stop_timestamp": float(activities_end_times_s[i]),
+                "start_frame": 0,
+                "stop_frame": 0,
+            }
+            # Only the rows of this activity are read from the file.
+            for arm in arms:
+                stream = self.h5_file[f"myo-{arm}"]["emg"]
+                begin, end = int(rows[arm][0][i]), int(rows[arm][1][i])
+                record[f"myo_{arm}_timestamps"] = np.reshape(stream["time_s"][begin:end], -1)
+                record[f"myo_{arm}_readings"] = stream["data"][begin:end]
+
+            records = dataset_augmentation(record, recording, i)
+            windows = {
+                arm: preprocess(fix_length([r[f"myo_{arm}_readings"] for r in records])).numpy()
+                for arm in arms
+            }
+            writer.append(
+                [
+                    {
+                        "uid": r["uid"],
+                        "label": label_dict[label],
+                        "video_name": recording,
+                        "features_EMG_left": windows["left"][k],
+                        "features_EMG_right": windows["right"][k],
+                    }
+                    for k, r in enumerate(records)
+                ]
+            )
+            index.extend(
+                {
+                    "uid": r["uid"],
+                    "activity": i,
+                    "sub_window": k,
+                    "label": label_dict[label],
+                    "description": label,
+                    "start_timestamp": r["start_timestamp"],
+                    "stop_timestamp": r["stop_timestamp"],
+                }
+                for k, r in enumerate(records)
+            )
+        writer.close()
+        pd.DataFrame(index).to_csv(os.path.join(out_path, "index.csv"), index=False)
+
+        print("Windows:", len(index))
+        print("Output :", out_path)
@@ -1,4 +1,6 @@
 import pickle
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 
 def get_data_from_pkl(pkl_file):
@@ -50,6 +52,48 @@ def get_data_from_pkl_pd(pkl_file):
 
     return data
 
+def recording_bytes(data):
+    # memory used by a recording: memory_usage counts each array cell as a small object, its data is added on top
+    arrays = sum(np.asarray(v).nbytes for column in data.columns if data[column].dtype == object
+                 for v in data[column] if isinstance(v, np.ndarray))
+    return int(data.memory_usage(index=True, deep=True).sum()) + arrays
+
+
+class RecordingCache(object):
+    """
+    LRU cache of the recordings read with get_data_from_pkl_pd, keyed by file.
+    A subject recording contains many activities: with the cache each recording is unpickled once per build,
+    not once per activity. Least recently used recordings are evicted when the cached ones exceed max_bytes.
+    """
+
+    def __init__(self, max_bytes=4 * 1024 ** 3):
+        self.max_bytes = max_bytes
+        self.recordings = OrderedDict()
+        self.sizes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, pkl_file):
+        if pkl_file in self.recordings:
+            self.hits += 1
+            self.recordings.move_to_end(pkl_file)
+            return self.recordings[pkl_file]
+
+        self.misses += 1
+        data = get_data_from_pkl_pd(pkl_file)
+        self.recordings[pkl_file] = data
+        self.sizes[pkl_file] = recording_bytes(data)
+        # the recording just read is always kept, even if alone it exceeds max_bytes
+        while sum(self.sizes.values()) > self.max_bytes and len(self.recordings) > 1:
+            evicted, _ = self.recordings.popitem(last=False)
+            del self.sizes[evicted]
+        return data
+
+    def clear(self):
+        self.recordings.clear()
+        self.sizes.clear()
+
+
 def extract_pkl_pd(pkl_folder):
     try:
         for i in range(len(pkl_folder)):
@@ -0,0 +1,178 @@
+"""
+Columnar on-disk format for the features extracted by save_feat.py.
+
+A feature store is a directory containing:
+    - header.json: format version, number of samples, modalities, dtype and per-sample shape of each array
+    - uids.bin: int64 (num_samples,)
+    - labels.bin: int64 (num_samples,)
+    - video_names.txt: one video name per line
+    - features_<modality>.bin: float32 (num_samples, *sample_shape)
+
+The .bin files are raw C-ordered blocks, so the loaders open them with np.memmap: every DataLoader worker
+shares the same pages through the OS cache, opening a store is instantaneous and nothing is ever unpickled.
+"""
+
+import json
+import os
+import numpy as np
+
+FORMAT_VERSION = 1
+HEADER_NAME = "header.json"
+
+
+def is_feature_store(path):
+    return os.path.isfile(os.path.join(path, HEADER_NAME))
+
+
+class FeatureStoreWriter(object):
+    """
+    Streams samples (dicts with uid, video_name, label and features_<modality>) to a feature store.
+    Samples are buffered and flushed every flush_every samples, so memory stays constant regardless of the
+    split size. Each flush commits the header with the number of rows written so far: after a crash the store
+    holds every flushed sample, and opening it again with resume=True truncates any partially written tail
+    and keeps appending (written_uids tells which samples can be skipped).
+    """
+
+    def __init__(self, path, modalities, flush_every=256, resume=False):
+        self.path = path
+        self.modalities = list(modalities)
+        self.flush_every = flush_every
+        self.num_samples = 0
+        self.sample_shapes = {}
+        self.written_uids = set()
+        self._buffer = []
+        os.makedirs(self.path, exist_ok=True)
+
+        mode = "wb"
+        if resume and is_feature_store(self.path):
+            self._truncate_to_header()
+            mode = "ab"
+        elif is_feature_store(self.path):
+            # the files are truncated below: the old header must not describe them until the first flush
+            os.remove(os.path.join(self.path, HEADER_NAME))
+        self._files = {"uids": open(os.path.join(self.path, "uids.bin"), mode),
+                       "labels": open(os.path.join(self.path, "labels.bin"), mode),
+                       "video_names": open(os.path.join(self.path, "video_names.txt"), mode[0])}
+        for m in self.modalities:
+            self._files["features_" + m] = open(os.path.join(self.path, "features_" + m + ".bin"), mode)
+
+    def _truncate_to_header(self):
+        with open(os.path.join(self.path, HEADER_NAME), "r") as f:
+            header = json.load(f)
+        if header["version"] != FORMAT_VERSION or header["modalities"] != self.modalities:
+            raise ValueError(f"Cannot resume {self.path}: written with version {header['version']} "
+                             f"and modalities {header['modalities']}")
+        self.num_samples = header["num_samples"]
+        # without any sample the header has no shapes yet, the first write sets them
+        if self.num_samples > 0:
+            self.sample_shapes = {m: header["features"][m]["shape"] for m in self.modalities}
+
+        # drop whatever was written after the last committed header
+        os.truncate(os.path.join(self.path, "uids.bin"), self.num_samples * 8)
+        os.truncate(os.path.join(self.path, "labels.bin"), self.num_samples * 8)
+        for m in self.modalities:
+            row_size = int(np.prod(self.sample_shapes.get(m, []), dtype=np.int64)) * 4
+            os.truncate(os.path.join(self.path, "features_" + m + ".bin"), self.num_samples * row_size)
+        with open(os.path.join(self.path, "video_names.txt"), "r") as f:
+            video_names = [line for line in f][:self.num_samples]
+        with open(os.path.join(self.path, "video_names.txt"), "w") as f:
+            f.writelines(video_names)
+
+        self.written_uids = set(np.fromfile(os.path.join(self.path, "uids.bin"), dtype=np.int64).tolist())
+
+    def append(self, samples):
+        self._buffer.extend(samples)
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def _write(self, samples):
+        np.asarray([int(s["uid"]) for s in samples], dtype=np.int64).tofile(self._files["uids"])
+        np.asarray([int(s.get("label", -1)) for s in samples], dtype=np.int64).tofile(self._files["labels"])
+        self._files["video_names"].write("".join(str(s.get("video_name", "")) + "\n" for s in samples))
+        for m in self.modalities:
+            features = np.ascontiguousarray(np.stack([s["features_" + m] for s in samples]), dtype=np.float32)
+            if m not in self.sample_shapes:
+                self.sample_shapes[m] = list(features.shape[1:])
+            elif list(features.shape[1:]) != self.sample_shapes[m]:
+                raise ValueError(f"Inconsistent {m} feature shape: got {list(features.shape[1:])}, "
+                                 f"expected {self.sample_shapes[m]}")
+            features.tofile(self._files["features_" + m])
+        self.num_samples += len(samples)
+        self.written_uids.update(int(s["uid"]) for s in samples)
+
+    def flush(self, complete=False):
+        if len(self._buffer) > 0:
+            self._write(self._buffer)
+            self._buffer = []
+        # the data must be on disk before the header says it is there
+        for f in self._files.values():
+            f.flush()
+            os.fsync(f.fileno())
+        self._write_header(complete)
+
+    def _header(self, complete):
+        return {"version": FORMAT_VERSION,
+                "num_samples": self.num_samples,
+                "complete": complete,
+                "modalities": self.modalities,
+                "uids": {"dtype": "int64", "shape": []},
+                "labels": {"dtype": "int64", "shape": []},
+                "features": {m: {"dtype": "float32", "shape": self.sample_shapes.get(m, [])}
+                             for m in self.modalities}}
+
+    def _write_header(self, complete):
+        # write-then-rename, so that a reader never sees a partially written header
+        tmp_path = os.path.join(self.path, HEADER_NAME + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self._header(complete), f, indent=1)
+        os.replace(tmp_path, os.path.join(self.path, HEADER_NAME))
+
+    def close(self):
+        self.flush(complete=True)
+        for f in self._files.values():
+            f.close()
+
+
+def write_feature_store(path, samples, modalities):
+    writer = FeatureStoreWriter(path, modalities)
+    writer.append(samples)
+    writer.close()
+
+
+class FeatureStore(object):
+    """
+    Read-only view over a feature store: uids, labels and features[modality] are np.memmap arrays,
+    uid_index maps each uid to its row.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(self.path, HEADER_NAME), "r") as f:
+            self.header = json.load(f)
+        if self.header["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported feature store version {self.header['version']} in {self.path}")
+        self.num_samples = self.header["num_samples"]
+        self.complete = self.header.get("complete", True)
+        self.modalities = self.header["modalities"]
+
+        self.uids = self._memmap("uids.bin", self.header["uids"])
+        self.labels = self._memmap("labels.bin", self.header["labels"])
+        self.features = {m: self._memmap("features_" + m + ".bin", self.header["features"][m])
+                         for m in self.modalities}
+
+        self.uid_index = {uid: row for row, uid in enumerate(self.uids.tolist())}
+        assert len(self.uid_index) == self.num_samples, f"Duplicated uids in {self.path}"
+
+    def _memmap(self, name, spec):
+        shape = (self.num_samples, *spec["shape"])
+        if self.num_samples == 0:
+            return np.empty(shape, dtype=spec["dtype"])
+        return np.memmap(os.path.join(self.path, name), dtype=spec["dtype"], mode="r", shape=shape)
+
+    @property
+    def video_names(self):
+        with open(os.path.join(self.path, "video_names.txt"), "r") as f:
+            return [line.rstrip("\n") for line in f][:self.num_samples]
+
+    def __len__(self):
+        return self.num_samples
@@ -0,0 +1,112 @@
+"""
+Random-access frame archives: all the JPEG frames of a video packed in a single <video_id>.frames file.
+
+Layout of a .frames file:
+    - header: magic (8 bytes), offset of the index (uint64), number of frames (uint64)
+    - the JPEG files, concatenated as they are (no compression, no padding)
+    - index: int64 (num_frames, 3) with frame number, byte offset and byte length of each frame, sorted by frame
+
+Reading a frame is a lookup in the index plus a single os.pread of its byte range, so frames can be sampled in any
+order without decompressing anything, and the same file can be read concurrently by all the DataLoader workers.
+"""
+
+import os
+import struct
+import numpy as np
+
+ARCHIVE_EXT = ".frames"
+MAGIC = b"FRMARCH1"
+HEADER = struct.Struct("<8sQQ")
+
+
+class FrameArchiveWriter(object):
+    """
+    Writes a .frames archive: add() appends the bytes of a frame, close() writes the index and the header.
+    The archive is written to path + ".tmp" and renamed on close, so an interrupted run never leaves a valid-looking
+    but incomplete archive behind.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._tmp_path = path + ".tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(HEADER.pack(MAGIC, 0, 0))
+        self._index = []
+
+    def add(self, frame, data):
+        self._index.append((frame, self._file.tell(), len(data)))
+        self._file.write(data)
+
+    def add_file(self, frame, file_path):
+        with open(file_path, "rb") as f:
+            self.add(frame, f.read())
+
+    def close(self):
+        index = np.asarray(sorted(self._index), dtype=np.int64).reshape(-1, 3)
+        if len(index) > 1 and np.any(index[1:, 0] == index[:-1, 0]):
+            raise ValueError(f"Duplicated frames in {self.path}")
+        index_offset = self._file.tell()
+        self._file.write(index.astype("<i8").tobytes())
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, index_offset, len(index)))
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(self._tmp_path)
+
+
+class FrameArchive(object):
+    """
+    Read-only view over a .frames archive.
+    frames: sorted array of the frame numbers in the archive
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._fd = os.open(path, os.O_RDONLY)
+        magic, index_offset, num_frames = HEADER.unpack(os.pread(self._fd, HEADER.size, 0))
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a frame archive")
+        index = np.frombuffer(os.pread(self._fd, num_frames * 24, index_offset), dtype="<i8").reshape(-1, 3)
+        self.frames, self.offsets, self.lengths = index[:, 0], index[:, 1], index[:, 2]
+
+    @property
+    def max_frame(self):
+        return int(self.frames[-1]) if len(self.frames) > 0 else -1
+
+    def _position(self, frame):
+        position = int(np.searchsorted(self.frames, frame))
+        if position == len(self.frames) or self.frames[position] != frame:
+            return None
+        return position
+
+    def __contains__(self, frame):
+        return self._position(frame) is not None
+
+    def __len__(self):
+        return len(self.frames)
+
+    def read(self, frame):
+        # bytes of the JPEG of frame, FileNotFoundError if the frame is not in the archive
+        position = self._position(frame)
+        if position is None:
+            raise FileNotFoundError(f"Frame {frame} not in {self.path}")
+        return os.pread(self._fd, int(self.lengths[position]), int(self.offsets[position]))
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,63 @@
+"""
+Persistent index of the last frame of each video folder, used by the loaders to clamp the frames sampled past the
+end of a video without listing the whole folder every time.
+The index is a json file {video folder: {"mtime_ns": ..., "max_frame": ...}}: an entry is reused as long as the
+modification time of the folder (which changes whenever frames are added or removed) is the same.
+The index lives in a per-user cache folder by default (dataset.frame_index to change it), out of the checkout.
+"""
+
+import json
+import os
+
+INDEX_NAME = "frame_index.json"
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".cache", "aml23-ego", INDEX_NAME)
+
+
+class FrameCountIndex(object):
+
+    def __init__(self, path, prefix="img_"):
+        self.path = path
+        self.prefix = prefix
+        self.videos = {}
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    self.videos = json.load(f)
+            except (OSError, ValueError):
+                # truncated or corrupt index: rebuilt from scratch, the folders are listed again
+                self.videos = {}
+
+    def max_frame(self, video_path):
+        # last frame index in video_path, the folder is listed only if it changed since the last time
+        video_path = os.path.abspath(video_path)
+        mtime_ns = os.stat(video_path).st_mtime_ns
+        entry = self.videos.get(video_path)
+        if entry is not None and entry["mtime_ns"] == mtime_ns:
+            return entry["max_frame"]
+
+        frames = [int(entry.name.split("_")[-1].split(".")[0]) for entry in os.scandir(video_path)
+                  if entry.name.startswith(self.prefix)]
+        if len(frames) == 0:
+            raise FileNotFoundError(f"No frames in {video_path}")
+        self.videos[video_path] = {"mtime_ns": mtime_ns, "max_frame": max(frames)}
+        self._save()
+        return max(frames)
+
+    def _save(self):
+        # write-then-rename, the DataLoader workers may update the index at the same time
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            try:
+                # keep the entries added by the other workers
+                with open(self.path, "r") as f:
+                    self.videos = dict(json.load(f), **self.videos)
+            except (FileNotFoundError, ValueError):
+                # no index yet, or a corrupt one that is overwritten
+                pass
+            with open(tmp_path, "w") as f:
+                json.dump(self.videos, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except (OSError, ValueError):
+            # read-only folder: the index is kept in memory only
+            pass
@@ -1,10 +1,12 @@
 import argparse
-from bz2 import compress
+import hashlib
+import json
 import os
 import tarfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
-import zipfile
 from tqdm.auto import tqdm
+from utils.frame_archive import ARCHIVE_EXT, FrameArchiveWriter
 
 margin = 8
 annotations_root = "train_val"
@@ -12,7 +14,119 @@ data_path = "/data/ggoletto/EpicKitchenDA/rgb_flow/"
 output_path = "utils/output/"
 
 
+class TarGzWriter(object):
+    """
+    Same interface as FrameArchiveWriter for a compressed tarball: written to path + ".tmp" and renamed on close
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._tmp_path = path + ".tmp"
+        self._tar = tarfile.open(self._tmp_path, mode='w:gz')
+
+    def add_file(self, frame, file_path):
+        self._tar.add(file_path, arcname=os.path.basename(file_path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._tar.close()
+        if exc_type is None:
+            os.replace(self._tmp_path, self.path)
+        else:
+            os.remove(self._tmp_path)
+
+
+def open_archive(path, archive_format):
+    if archive_format == "frames":
+        # random-access archive read by the loaders (dataset_conf.RGB.backend: archive)
+        return FrameArchiveWriter(path)
+    return TarGzWriter(path)
+
+
+def frame_ranges(segments):
+    """
+    segments: list of (start_frame, stop_frame) of the annotations of a video
+    returns the union of the [start - margin, stop + margin] ranges as sorted, disjoint [first, last] intervals
+    """
+    merged = []
+    for start, stop in sorted((int(start) - margin, int(stop) + margin) for start, stop in segments):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return merged
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_up_to_date(zfile, ranges, verify):
+    # an archive is reused if its manifest was written for the same frame ranges and, with verify,
+    # if its content still matches the recorded checksum; an unreadable manifest means the archive is stale
+    if not os.path.exists(zfile) or not os.path.exists(zfile + ".json"):
+        return False
+    try:
+        with open(zfile + ".json", "r") as f:
+            manifest = json.load(f)
+        if manifest["ranges"] != ranges or manifest["size"] != os.path.getsize(zfile):
+            return False
+        return not verify or manifest["sha256"] == file_sha256(zfile)
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+
+
+def archive_video(video_id, segments, extension, archive_format, verify):
+    """
+    Archives the frames of one video (runs in a worker process).
+    returns (video_id, archived frames or None if the existing archive was kept, missing frames)
+    """
+    ranges = frame_ranges(segments)
+    zfile = os.path.join(output_path, f"{video_id}{extension}")
+    if is_up_to_date(zfile, ranges, verify):
+        return video_id, None, []
+
+    # one listdir per video instead of one os.path.exists per frame
+    video_path = os.path.join(data_path, video_id)
+    available = set(os.listdir(video_path)) if os.path.isdir(video_path) else set()
+
+    if os.path.exists(zfile + ".json"):
+        # the manifest of the previous archive must not outlive it
+        os.remove(zfile + ".json")
+    archived, missing = 0, []
+    with open_archive(zfile, archive_format) as archive:
+        for first, last in ranges:
+            for frame in range(first, last + 1):
+                fn = f"img_{frame:010d}.jpg"
+                if fn not in available:
+                    missing.append(fn)
+                    continue
+                archive.add_file(frame, os.path.join(video_path, fn))
+                archived += 1
+
+    # the manifest is written last: an interrupted run leaves an archive without manifest, rebuilt next time
+    with open(zfile + ".json", "w") as f:
+        json.dump({"ranges": ranges, "size": os.path.getsize(zfile), "sha256": file_sha256(zfile),
+                   "frames": archived, "missing": len(missing)}, f)
+    return video_id, archived, missing
+
+
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--format", choices=["frames", "tar.gz"], default="frames",
+                        help="frames: one random-access .frames file per video, tar.gz: compressed tarball")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, default one per core")
+    parser.add_argument("--verify", action="store_true",
+                        help="check the checksum of the existing archives before skipping them")
+    args = parser.parse_args()
+    extension = ARCHIVE_EXT if args.format == "frames" else ".tar.gz"
+
     # Read all annotations
     annotations = pd.concat([
         pd.read_pickle(os.path.join(annotations_root, annotations))
@@ -21,39 +135,31 @@ def main():
 
     os.makedirs(output_path, exist_ok=True)
 
-    print(len(annotations.video_id.unique()))
-
-    for video_id in annotations.video_id.unique():
-        seen = []
-
-        video_annotations = annotations[annotations.video_id == video_id]
-
-        print(f"Processing {video_id} [length={len(video_annotations)}]...")
-
-        try:
-            zfile = os.path.join(output_path, f"{video_id}.tar.gz")
-
-            if os.path.exists(zfile):
+    videos = {video_id: list(zip(video_annotations.start_frame, video_annotations.stop_frame))
+              for video_id, video_annotations in annotations.groupby("video_id")}
+    print(len(videos))
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(archive_video, video_id, segments, extension, args.format, args.verify): video_id
+                   for video_id, segments in videos.items()}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            # a failing video is reported and the others keep going
+            try:
+                video_id, archived, missing = future.result()
+            except Exception as e:
+                print(f"{futures[future]}: failed, {type(e).__name__}: {e}")
+                failed.append(futures[future])
                 continue
-            
-            with tarfile.open(zfile, mode='w:gz') as archive:
-                for _, row in tqdm(video_annotations.iterrows()):
-                    start_frame, stop_frame = row.start_frame, row.stop_frame
-
-                    for frame in range(start_frame - margin, stop_frame + margin + 1):
-                        if frame in seen:
-                            continue
-
-                        seen.append(frame)
-                        fn = f"img_{frame:010d}.jpg"
-                        if not os.path.exists(os.path.join(data_path, video_id, fn)):
-                            print(f"Frame {fn} is missing.")
-                            continue
-
-                        archive.add(os.path.join(data_path, video_id, fn), arcname=fn)
+            if archived is None:
+                print(f"{video_id}: up to date, skipped")
+                continue
+            print(f"{video_id}: {archived} frames archived, {len(missing)} missing")
+            for fn in missing:
+                print(f"Frame {fn} is missing.")
 
-        except zipfile.BadZipFile as error:
-            print(error)
+    if failed:
+        print(f"{len(failed)} videos failed: {', '.join(sorted(failed))}")
 
 
 if __name__ == "__main__":
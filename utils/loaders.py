@@ -1,17 +1,25 @@
-import glob
+import io
 from abc import ABC
+from collections import OrderedDict
 import pandas as pd
 from .epic_record import EpicVideoRecord
 from .action_record import ActionEMGRecord
+from .feature_store import FeatureStore, is_feature_store
+from .frame_archive import ARCHIVE_EXT, FrameArchive
+from .frame_index import DEFAULT_INDEX_PATH, FrameCountIndex
 import torch
 import torch.utils.data as data
+from torch.utils.data.dataloader import default_collate
 import torch.nn.functional as F
+import torchvision
 from PIL import Image
 import os
 import os.path
 from utils.logger import logger
 import numpy as np
-from scipy.signal import butter, filtfilt
+from utils.emg_preprocessing import preprocess, preprocess_records
+from utils.spec_emg import get_spectrogram_engine
+from utils.transforms import ClipBatchTransform, ClipFromGroup, ClipScale, GroupMultiScaleCrop, GroupScale
 
 class EpicKitchensDataset(data.Dataset, ABC):
     def __init__(self, split, modalities, mode, dataset_conf, num_frames_per_clip, num_clips, dense_sampling,
@@ -57,19 +65,70 @@ class EpicKitchensDataset(data.Dataset, ABC):
         self.transform = transform  # pipeline of transforms
         self.load_feat = load_feat
 
+        # dataset_conf.batch_augmentation: the workers only decode the frames and return uint8 clips (T, H, W, C),
+        # the rest of the pipeline runs on whole batches in the main process (augment_batch); it requires the clip
+        # transforms (models.RGB.tensor_transforms)
+        # dataset_conf[m].decoder, see decode_image: pil_draft decodes at a reduced scale, which keeps the field of view
+        # only if the pipeline rescales the frames first (MultiScaleCrop, Scale), not with a fixed size crop (CenterCrop)
+        self.decoders = {}
+        for m in self.modalities:
+            decoder = self.dataset_conf[m].get("decoder", "pil")
+            transforms = getattr(self.transform[m], "transforms", []) if self.transform is not None else []
+            if decoder == "pil_draft" and not rescales_first(transforms):
+                logger.warning(f"The {m} pipeline does not rescale the frames first, pil_draft replaced by pil")
+                decoder = "pil"
+            if decoder == "torchvision" and (len(transforms) == 0 or not isinstance(transforms[0], ClipFromGroup)):
+                raise ValueError(f"The torchvision decoder returns tensors, set models.{m}.tensor_transforms to True")
+            self.decoders[m] = decoder
+
+        self.batch_transform = None
+        if self.transform is not None and self.dataset_conf.get("batch_augmentation", False):
+            self.batch_transform = {}
+            for m in self.modalities:
+                transforms = self.transform[m].transforms
+                if not isinstance(transforms[0], ClipFromGroup):
+                    raise ValueError(f"batch_augmentation requires a clip pipeline for {m}, "
+                                     f"set models.{m}.tensor_transforms to True")
+                self.batch_transform[m] = ClipBatchTransform(transforms[1:])
+            self.transform = {m: ClipFromGroup() for m in self.modalities}
+        # (modality, video) -> FrameArchive, for dataset_conf[modality].backend == archive; the archives hold raw fds,
+        # so they are opened lazily by each worker and dropped when the dataset is pickled (see __getstate__)
+        self.frame_archives = {}
+        # last frame of each video folder, for the frames sampled past the end of a video
+        self.frame_index = FrameCountIndex(self.dataset_conf.get("frame_index", None) or DEFAULT_INDEX_PATH)
+        # decoded frames shared between samples, dataset_conf.frame_cache_mb: 0 disables the cache
+        frame_cache_mb = self.dataset_conf.get("frame_cache_mb", 0)
+        self.frame_cache = FrameCache(frame_cache_mb * 1024 ** 2) if frame_cache_mb > 0 else None
+
         if self.load_feat:
-            self.model_features = None
+            # self.model_features[m] is a (num_samples, ...) float32 matrix and self.feature_uid_index[m] maps
+            # each uid to its row, so that __getitem__ is a dictionary lookup plus an array slice
+            self.model_features = {}
+            self.feature_uid_index = {}
             for m in self.modalities:
                 # load features for each modality
-                model_features = pd.DataFrame(pd.read_pickle(os.path.join("saved_features",
-                                                                          self.dataset_conf[m].features_name + "_" +
-                                                                          pickle_name))['features'])[["uid", "features_" + m]]
-                if self.model_features is None:
-                    self.model_features = model_features
+                features_path = os.path.join("saved_features", self.dataset_conf[m].features_name + "_" + pickle_name)
+                store_path = os.path.splitext(features_path)[0]
+                if is_feature_store(store_path) and os.path.isfile(features_path):
+                    # the pickle may hold aggregated features and the store per clip ones, do not pick one silently
+                    raise ValueError(f"Both {store_path} and {features_path} exist, remove the one not to be used")
+                if is_feature_store(store_path):
+                    # columnar store written by save_feat.py: memory-mapped, shared by all the workers
+                    store = FeatureStore(store_path)
+                    if not store.complete:
+                        logger.warning(f"Feature store {store_path} is incomplete, only {len(store)} samples available")
+                    self.model_features[m] = store.features[m]
+                    self.feature_uid_index[m] = store.uid_index
                 else:
-                    self.model_features = pd.merge(self.model_features, model_features, how="inner", on="uid")
+                    self._load_pickle_features(m, features_path)
 
-            self.model_features = pd.merge(self.model_features, self.list_file, how="inner", on="uid")
+    def _load_pickle_features(self, modality, features_path):
+        model_features = pd.DataFrame(pd.read_pickle(features_path)['features'])[["uid", "features_" + modality]]
+        uids = model_features["uid"].astype(int).tolist()
+        self.feature_uid_index[modality] = {uid: row for row, uid in enumerate(uids)}
+        assert len(self.feature_uid_index[modality]) == len(uids), f"Duplicated uids in {features_path}"
+        self.model_features[modality] = np.ascontiguousarray(np.stack(model_features["features_" + modality].values),
+                                                             dtype=np.float32)
 
     def _get_train_indices(self, record, modality='RGB'):
         record_num_frames = record.num_frames[modality]
@@ -182,10 +241,9 @@ class EpicKitchensDataset(data.Dataset, ABC):
 
         if self.load_feat:
             sample = {}
-            sample_row = self.model_features[self.model_features["uid"] == int(record.uid)]
-            assert len(sample_row) == 1
             for m in self.modalities:
-                sample[m] = sample_row["features_" + m].values[0]
+                assert int(record.uid) in self.feature_uid_index[m], f"No saved {m} features for uid {record.uid}"
+                sample[m] = np.array(self.model_features[m][self.feature_uid_index[m][int(record.uid)]])
             if self.additional_info:
                 return sample, record.label, record.untrimmed_video_name, record.uid
             else:
@@ -223,42 +281,208 @@ class EpicKitchensDataset(data.Dataset, ABC):
         return process_data, record.label
 
     def _load_data(self, modality, record, idx):
-        data_path = self.dataset_conf[modality].data_path
-        tmpl = self.dataset_conf[modality].tmpl
-
         if modality == 'RGB' or modality == 'RGBDiff':
             # here the offset for the starting index of the sample is added
 
             idx_untrimmed = record.start_frame + idx    #start_frame decrementa di 1
             #logger.info(str(record.start_frame) + " - " + str(idx) + " - " + str(idx_untrimmed))
-            try:
-                img = Image.open(os.path.join(data_path, record.untrimmed_video_name, tmpl.format(idx_untrimmed))) \
-                    .convert('RGB')
-            except FileNotFoundError:
-                print("Img not found")
-                max_idx_video = int(sorted(glob.glob(os.path.join(data_path,
-                                                                  record.untrimmed_video_name,
-                                                                  "img_*")))[-1].split("_")[-1].split(".")[0])
-                if idx_untrimmed > max_idx_video:
-                    img = Image.open(os.path.join(data_path, record.untrimmed_video_name, tmpl.format(max_idx_video))) \
-                        .convert('RGB')
-                else:
-                    raise FileNotFoundError
-            return [img]
+            if self.frame_cache is not None:
+                # overlapping samples (and epochs, with persistent workers) share the decoded frames
+                return [self.frame_cache.get((modality, record.untrimmed_video_name, idx_untrimmed),
+                                             lambda: self._decode_frame(modality, record, idx_untrimmed))]
+            return [self._decode_frame(modality, record, idx_untrimmed)]
         
         else:
             raise NotImplementedError("Modality not implemented")
 
+    def augment_batch(self, data):
+        # data: dict modality -> batch returned by the DataLoader; identity without batch_augmentation
+        if self.batch_transform is None:
+            return data
+        return {m: self.batch_transform[m](data[m]) if m in self.batch_transform else data[m] for m in data}
+
+    def _decode_frame(self, modality, record, idx_untrimmed):
+        if self.dataset_conf[modality].get("backend", "folder") == "archive":
+            return self._load_archive_frame(modality, record, idx_untrimmed)
+
+        data_path = self.dataset_conf[modality].data_path
+        tmpl = self.dataset_conf[modality].tmpl
+        try:
+            img = self._open_image(modality, os.path.join(data_path, record.untrimmed_video_name,
+                                                          tmpl.format(idx_untrimmed)))
+        except FileNotFoundError:
+            print("Img not found")
+            max_idx_video = self.frame_index.max_frame(os.path.join(data_path, record.untrimmed_video_name))
+            if idx_untrimmed > max_idx_video:
+                img = self._open_image(modality, os.path.join(data_path, record.untrimmed_video_name,
+                                                              tmpl.format(max_idx_video)))
+            else:
+                raise FileNotFoundError
+        return img
+
+    def _load_archive_frame(self, modality, record, idx_untrimmed):
+        # one .frames archive per video (see utils/frame_archive.py), opened once by each worker
+        key = (modality, record.untrimmed_video_name)
+        if key not in self.frame_archives:
+            self.frame_archives[key] = FrameArchive(os.path.join(self.dataset_conf[modality].data_path,
+                                                                 record.untrimmed_video_name + ARCHIVE_EXT))
+        archive = self.frame_archives[key]
+
+        if idx_untrimmed not in archive:
+            logger.warning(f"Frame {idx_untrimmed} not in {archive.path}")
+            if idx_untrimmed > archive.max_frame:
+                idx_untrimmed = archive.max_frame
+            else:
+                raise FileNotFoundError
+        return self._open_image(modality, archive.read(idx_untrimmed))
+
+    def _open_image(self, modality, source):
+        # with pil_draft the frames are decoded down to the input resolution of the model at most
+        return decode_image(source, self.decoders[modality],
+                            self.dataset_conf[modality].get("decode_size", self.dataset_conf.get("resolution")))
+
+    def __getstate__(self):
+        # the fds of the open archives are not valid in another process (e.g. spawn-started DataLoader workers)
+        state = self.__dict__.copy()
+        state["frame_archives"] = {}
+        return state
+
     def __len__(self):
         return len(self.video_list)
 
+def decode_image(source, decoder="pil", min_size=None):
+    """
+    source: path or bytes of a JPEG frame
+    decoder: str
+        - pil: PIL, full resolution
+        - pil_draft: PIL in draft mode, the JPEG is decoded directly at 1/2, 1/4 or 1/8 of its resolution (DCT scaling),
+          the smallest scale with both sides still >= min_size. The frame is smaller than with pil, so it is only
+          equivalent for pipelines that rescale the frames before cropping (see rescales_first)
+        - torchvision: torchvision.io.decode_jpeg (libjpeg-turbo), full resolution, for the clip transforms
+    returns an RGB PIL image, as expected by the Group transforms, or an uint8 tensor (H, W, C) with torchvision
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            source = f.read()
+
+    if decoder == "torchvision":
+        img = torchvision.io.decode_jpeg(torch.frombuffer(bytearray(source), dtype=torch.uint8),
+                                         mode=torchvision.io.ImageReadMode.RGB)
+        return img.permute(1, 2, 0)
+
+    img = Image.open(io.BytesIO(source))
+    if decoder == "pil_draft" and min_size is not None:
+        img.draft('RGB', (min_size, min_size))
+    elif decoder != "pil" and decoder != "pil_draft":
+        raise ValueError(f"Unknown decoder {decoder}")
+    return img.convert('RGB')
+
+
+def rescales_first(transforms):
+    # True if the first spatial transform of the pipeline rescales the frames to the input size of the model
+    transforms = [t for t in transforms if not isinstance(t, ClipFromGroup)]
+    return len(transforms) > 0 and isinstance(transforms[0], (GroupMultiScaleCrop, GroupScale, ClipScale))
+
+
+class FrameCache(object):
+    """
+    LRU cache of decoded frames (PIL images or uint8 tensors) keyed by (modality, video, frame index), evicting the least
+    recently used frames when the cached ones exceed max_bytes.
+    Each DataLoader worker has its own copy of the dataset and therefore its own cache: the budget is per worker, and
+    the cache only survives across epochs if the DataLoader uses persistent_workers=True.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.frames = OrderedDict()
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load):
+        if key in self.frames:
+            self.hits += 1
+            self.frames.move_to_end(key)
+            return self.frames[key][0]
+
+        self.misses += 1
+        frame = load()
+        size = frame.numel() if torch.is_tensor(frame) else frame.width * frame.height * len(frame.getbands())
+        if size <= self.max_bytes:
+            self.frames[key] = (frame, size)
+            self.num_bytes += size
+            while self.num_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.frames.popitem(last=False)
+                self.num_bytes -= evicted_size
+        return frame
+
+    def __repr__(self):
+        return (f"FrameCache({len(self.frames)} frames, {self.num_bytes / 1024 ** 2:.1f}/"
+                f"{self.max_bytes / 1024 ** 2:.1f} MB, hits={self.hits}, misses={self.misses})")
+
+
+class OnlineSpectrogram(object):
+    """
+    collate_fn computing the EMG spectrograms of a whole batch with a single batched STFT, so that the
+    spectrogram parameters are a config knob instead of requiring a rebuild of the *_spe pickles.
+    The samples must contain "EMG" (2, time, channels), i.e. preprocessed left and right readings, and "EMG_uid";
+    the batch returned contains "EMG" (batch, 1, 2 * channels, freq_bins, frames) like the precomputed pickles.
+    cache_size: number of spectrograms kept in a LRU cache (0 disables it), notice that each DataLoader worker
+        has its own copy of the collate_fn and therefore its own cache
+    """
+
+    def __init__(self, n_fft=32, hop_length=4, cache_size=0):
+        self.engine = get_spectrogram_engine(n_fft=n_fft, hop_length=hop_length)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    @classmethod
+    def from_conf(cls, spectrogram_conf):
+        return cls(n_fft=spectrogram_conf.get("n_fft", 32), hop_length=spectrogram_conf.get("hop_length", 4),
+                   cache_size=spectrogram_conf.get("cache_size", 0))
+
+    def __call__(self, batch):
+        data, label = default_collate(batch)
+        uids = data.pop("EMG_uid").tolist()
+        readings = data["EMG"]
+
+        spectrograms = [self.cache.get(uid) for uid in uids]
+        missing = [i for i, spect in enumerate(spectrograms) if spect is None]
+        if len(missing) > 0:
+            # (missing, 2, time, channels) -> (missing, 2, channels, freq_bins, frames)
+            computed = self.engine(readings[missing])
+            for i, spect in zip(missing, computed):
+                spectrograms[i] = spect
+                if self.cache_size > 0:
+                    self.cache[uids[i]] = spect
+        if self.cache_size > 0:
+            for uid in uids:
+                self.cache.move_to_end(uid)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        spectrograms = torch.stack(spectrograms)
+        # left and right channels are concatenated: (batch, 2 * channels, freq_bins, frames)
+        data["EMG"] = spectrograms.reshape(spectrograms.size(0), -1, *spectrograms.shape[3:]).unsqueeze(1)
+        return data, label
+
+
 class ActionNetDataset(data.Dataset, ABC):
     def __init__(self, mode, dataset_conf, conv=True):
+        """
+        conv: bool, True to return EMG spectrograms, False to return the preprocessed readings
+        dataset_conf may contain spectrogram.online: bool, if True (and conv) the spectrograms are computed from the
+            raw readings when the batch is collated, see OnlineSpectrogram; the DataLoader must be built with
+            collate_fn=dataset.collate_fn
+        """
         self.mode = mode  # 'train', 'val' or 'test'
         self.dataset_conf = dataset_conf
         self.conv = conv
+        spectrogram_conf = self.dataset_conf.get("spectrogram", None)
+        self.online_spectrogram = self.conv and spectrogram_conf is not None and spectrogram_conf.get("online", False)
+        self.collate_fn = OnlineSpectrogram.from_conf(spectrogram_conf) if self.online_spectrogram else default_collate
 
-        if self.conv:
+        if self.conv and not self.online_spectrogram:
             if self.mode == "train":
                 pickle_name_emg = "D4_emg_spe_train.pkl"
                 pickle_name_rbg = "feature_extracted_D4_train.pkl"
@@ -278,46 +502,9 @@ class ActionNetDataset(data.Dataset, ABC):
 
         self.list_rgb = pd.read_pickle(os.path.join(self.dataset_conf.annotations_path, pickle_name_rbg))["features"]
 
-
-    def _preprocess(self, readings):
-        #* apply preprocessing to the EMG data
-
-        #* Rectification
-        # abs value
-        readings_rectified = np.abs(readings)
-        #* low-pass Filter
-        # Frequenza di campionamento (Hz)
-        fs = 160  # Frequenza dei sampling data da loro
-        f_cutoff = 5  # Frequenza di taglio
-
-        # Ordine del filtro
-        order = 4 
-        # Calcolo dei coefficienti del filtro
-        b, a = butter(order, f_cutoff / (fs / 2), btype='low')
-        # Concateno tutti i vettori in un'unica matrice
-        readings_filtered = np.zeros_like(readings_rectified, dtype=float)
-        for i in range(8):  # 8 colonne
-            readings_filtered[:, i] = filtfilt(b, a, readings_rectified[:, i])
-
-        #print(readings_rectified[:6], readings_rectified.shape)
-        #print(readings_filtered[:6], readings_filtered.shape)
-        # exit()
-
-        # convert to tensor
-        readings_filtered = torch.tensor(readings_filtered, dtype=torch.float32)
-        
-        min_val, _ = torch.min(readings_filtered, dim=1, keepdim=True)
-        max_val, _ = torch.max(readings_filtered, dim=1, keepdim=True)
-
-        g = max_val - min_val + 0.0001
-
-        # # Normalize the data to the range -1 to 1
-        normalized_data = 2 * (readings_filtered - min_val) / g - 1
-
-        #print(normalized_data[:6], normalized_data.shape)
-
-
-        return normalized_data
+        # the preprocessing is deterministic: done once for the whole dataset, with a single batched filtfilt
+        self.preprocessed_emg = None if self.conv and not self.online_spectrogram \
+            else preprocess_records(self.emg_list)
 
     def __getitem__(self, index):
         # record is a row of the pkl file containing one sample/action
@@ -326,15 +513,24 @@ class ActionNetDataset(data.Dataset, ABC):
 
         # get EMG sample
         record_emg = self.emg_list[index]
-        if self.conv:
+        if self.online_spectrogram:
+            # (2, time, channels), the spectrograms are computed by self.collate_fn
+            if self.preprocessed_emg is not None:
+                sample = self.preprocessed_emg[index]
+            else:
+                sample = torch.stack((preprocess(record_emg.myo_left_readings),
+                                      preprocess(record_emg.myo_right_readings)))
+        elif self.conv:
             left_readings = record_emg.myo_left_readings
             right_readings = record_emg.myo_right_readings
             sample = (np.concatenate((left_readings, right_readings), axis=0))
+            sample = torch.tensor(sample, dtype=torch.float32)
+        elif self.preprocessed_emg is not None:
+            sample = torch.cat((self.preprocessed_emg[index, 0], self.preprocessed_emg[index, 1]), dim=1)
         else:
-            left_readings = self._preprocess(record_emg.myo_left_readings) 
-            right_readings = self._preprocess(record_emg.myo_right_readings)
-            sample = (np.concatenate((left_readings, right_readings), axis=1))
-        sample = torch.tensor(sample, dtype=torch.float32)
+            left_readings = preprocess(record_emg.myo_left_readings)
+            right_readings = preprocess(record_emg.myo_right_readings)
+            sample = torch.cat((left_readings, right_readings), dim=1)
 
         # get RGB sample
         record_rgb = self.list_rgb[index]
@@ -346,7 +542,10 @@ class ActionNetDataset(data.Dataset, ABC):
         label = record_emg.label
         label = torch.tensor(label)
 
-        dict = {"EMG": sample.unsqueeze(0), "RGB": features}
+        if self.online_spectrogram:
+            dict = {"EMG": sample, "EMG_uid": index, "RGB": features}
+        else:
+            dict = {"EMG": sample.unsqueeze(0), "RGB": features}
         return dict, label
     
     def __len__(self):
@@ -354,6 +553,12 @@ class ActionNetDataset(data.Dataset, ABC):
 
 class ActionEMGDataset(data.Dataset, ABC):
     def __init__(self, split, mode, dataset_conf, additional_info=False, conv=True):
+        """
+        conv: bool, True to return EMG spectrograms, False to return the preprocessed readings
+        dataset_conf may contain spectrogram.online: bool, if True (and conv) the spectrograms are computed from the
+            raw readings when the batch is collated, see OnlineSpectrogram; the DataLoader must be built with
+            collate_fn=dataset.collate_fn
+        """
         self.mode = mode  # 'train', 'val' or 'test'
         self.dataset_conf = dataset_conf
         self.stride = self.dataset_conf.stride
@@ -362,8 +567,11 @@ class ActionEMGDataset(data.Dataset, ABC):
         self.max_length_left = 0
         self.max_length_right = 0
         self.conv = conv
+        spectrogram_conf = self.dataset_conf.get("spectrogram", None)
+        self.online_spectrogram = self.conv and spectrogram_conf is not None and spectrogram_conf.get("online", False)
+        self.collate_fn = OnlineSpectrogram.from_conf(spectrogram_conf) if self.online_spectrogram else default_collate
 
-        if self.conv:
+        if self.conv and not self.online_spectrogram:
             if self.mode == "train":
                 pickle_name = "big_file_train_spe.pkl"
             else:
@@ -377,46 +585,9 @@ class ActionEMGDataset(data.Dataset, ABC):
         self.list_file = pd.read_pickle(os.path.join(self.dataset_conf.annotations_path, pickle_name))
         self.emg_list = [ActionEMGRecord(tup, self.dataset_conf) for tup in self.list_file["features"]]
 
-
-    def _preprocess(self, readings):
-        #* apply preprocessing to the EMG data
-
-        #* Rectification
-        # abs value
-        readings_rectified = np.abs(readings)
-        #* low-pass Filter
-        # Frequenza di campionamento (Hz)
-        fs = 160  # Frequenza dei sampling data da loro
-        f_cutoff = 5  # Frequenza di taglio
-
-        # Ordine del filtro
-        order = 4 
-        # Calcolo dei coefficienti del filtro
-        b, a = butter(order, f_cutoff / (fs / 2), btype='low')
-        # Concateno tutti i vettori in un'unica matrice
-        readings_filtered = np.zeros_like(readings_rectified, dtype=float)
-        for i in range(8):  # 8 colonne
-            readings_filtered[:, i] = filtfilt(b, a, readings_rectified[:, i])
-
-        #print(readings_rectified[:6], readings_rectified.shape)
-        #print(readings_filtered[:6], readings_filtered.shape)
-        # exit()
-
-        # convert to tensor
-        readings_filtered = torch.tensor(readings_filtered, dtype=torch.float32)
-        
-        min_val, _ = torch.min(readings_filtered, dim=1, keepdim=True)
-        max_val, _ = torch.max(readings_filtered, dim=1, keepdim=True)
-
-        g = max_val - min_val + 0.0001
-
-        # # Normalize the data to the range -1 to 1
-        normalized_data = 2 * (readings_filtered - min_val) / g - 1
-
-        #print(normalized_data[:6], normalized_data.shape)
-
-
-        return normalized_data
+        # the preprocessing is deterministic: done once for the whole dataset, with a single batched filtfilt
+        self.preprocessed_emg = None if self.conv and not self.online_spectrogram \
+            else preprocess_records(self.emg_list)
 
     def __getitem__(self, index):
         # record is a row of the pkl file containing one sample/action
@@ -425,16 +596,25 @@ class ActionEMGDataset(data.Dataset, ABC):
 
         record = self.emg_list[index]
 
-        if self.conv:
+        if self.online_spectrogram:
+            # (2, time, channels), the spectrograms are computed by self.collate_fn
+            if self.preprocessed_emg is not None:
+                sample = self.preprocessed_emg[index]
+            else:
+                sample = torch.stack((preprocess(record.myo_left_readings), preprocess(record.myo_right_readings)))
+            return {"EMG": sample, "EMG_uid": index}, torch.tensor(record.label)
+        elif self.conv:
             left_readings = record.myo_left_readings
             right_readings = record.myo_right_readings
             sample = (np.concatenate((left_readings, right_readings), axis=0))
+            sample = torch.tensor(sample, dtype=torch.float32)
+        elif self.preprocessed_emg is not None:
+            sample = torch.cat((self.preprocessed_emg[index, 0], self.preprocessed_emg[index, 1]), dim=1)
         else:
-            left_readings = self._preprocess(record.myo_left_readings)
-            right_readings = self._preprocess(record.myo_right_readings)
-            sample = (np.concatenate((left_readings, right_readings), axis=1))
+            left_readings = preprocess(record.myo_left_readings)
+            right_readings = preprocess(record.myo_right_readings)
+            sample = torch.cat((left_readings, right_readings), dim=1)
 
-        sample = torch.tensor(sample, dtype=torch.float32)
         label = torch.tensor(record.label)
         out = {"EMG": sample.unsqueeze(0)} 
         return out, label
@@ -1,6 +1,6 @@
 import pandas as pd
 import pickle
-from utils.extract_pkl import get_data_from_pkl
+from utils.extract_pkl import get_data_from_pkl, RecordingCache
 import numpy
 import math
 from pprint import pprint
@@ -17,6 +17,8 @@ def save_into_big_pkl(action_net_path, big_file_path, label_dict):
     actionNet_train = get_data_from_pkl_pd(action_net_path);
     data = {"features": []}
     len_time = 100
+    # see RecordingCache
+    recordings = RecordingCache()
     
     # read each row of actionNet_train
     for i in range(len(actionNet_train)):
@@ -27,7 +29,7 @@ def save_into_big_pkl(action_net_path, big_file_path, label_dict):
         id = file + "_" + str(index)
 
         # get readings and timestamps from the file
-        Spkl = get_data_from_pkl_pd("readings/" + file.strip(".pkl"))
+        Spkl = recordings.get("readings/" + file.strip(".pkl"))
         right_readings = Spkl.myo_right_readings[index]
         left_readings = Spkl.myo_left_readings[index]
   
@@ -0,0 +1,114 @@
+"""
+Parallel builders of the ActionNet EMG datasets.
+The work is sharded by subject recording over a ProcessPoolExecutor: each worker unpickles its recording once
+and cuts all the activities it contains. The uids are content-addressed (utils.utils.make_uid) and results are
+merged in the order of the split, so the output is the same as the serial builders of dataset_creator and does
+not depend on the number of workers.
+"""
+
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import torch
+from utils.dataset_creator import recording_spectrograms, recording_windows, row_windows, split_recordings
+from utils.extract_pkl import get_data_from_pkl_pd
+from utils.utils import recording_name
+
+STAGES = ["load", "windows", "spectrogram"]
+
+
+def _init_worker():
+    # one process per core already, avoid oversubscribing the cores with torch threads
+    torch.set_num_threads(1)
+
+
+def _build_recording(file, rows, spectrogram):
+    """
+    rows: list of (position in the split, index in the recording, label) of the rows of the split in file
+    returns the list of (position, windows) and the seconds spent in each stage
+    """
+    timings = {stage: 0.0 for stage in STAGES}
+
+    start = time.perf_counter()
+    file_pkl = get_data_from_pkl_pd("action-net/pickles/" + file.strip(".pkl"))
+    timings["load"] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    recording = recording_name(file)
+    results = [(position, row_windows(file_pkl, recording, index, label)) for position, index, label in rows]
+    timings["windows"] += time.perf_counter() - start
+
+    if spectrogram:
+        start = time.perf_counter()
+        # all the windows of the recording in one batched call per arm, as the serial builder does
+        spect = recording_spectrograms([w for _, row in results for w in row])
+        bounds = np.cumsum([0] + [len(row) for _, row in results])
+        results = [(position, spect[bounds[j]:bounds[j + 1]]) for j, (position, _) in enumerate(results)]
+        timings["spectrogram"] += time.perf_counter() - start
+
+    return results, timings
+
+
+def report_throughput(name, num_windows, timings, wall_time):
+    print(f"{name}: {num_windows} windows in {wall_time:.1f}s ({num_windows / max(wall_time, 1e-9):.1f} windows/s)")
+    for stage in STAGES:
+        if timings[stage] > 0:
+            print(f"  {stage}: {timings[stage]:.1f}s of worker time "
+                  f"({num_windows / timings[stage]:.1f} windows/s per worker)")
+
+
+def emg_dataset_parallel(path, out_path, spectrogram=False, workers=None):
+    """
+    Parallel version of dataset_creator.emg_dataset (spectrogram=False) and
+    dataset_creator.emg_dataset_spettrogram (spectrogram=True), same output.
+    workers: number of processes, None for one per core
+    """
+    start = time.perf_counter()
+    actionNet_train = get_data_from_pkl_pd(path)
+
+    # shard the rows of the split by recording file
+    shards = split_recordings(actionNet_train)
+
+    rows = [[] for _ in range(len(actionNet_train))]
+    timings = {stage: 0.0 for stage in STAGES}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = [executor.submit(_build_recording, file, file_rows, spectrogram)
+                   for file, file_rows in shards.items()]
+        for future in futures:
+            results, shard_timings = future.result()
+            for position, windows in results:
+                rows[position] = windows
+            for stage in STAGES:
+                timings[stage] += shard_timings[stage]
+
+    # deterministic merge, in the order of the split as emg_windows does
+    data = {"features": []}
+    for windows in rows:
+        for w in windows:
+            if spectrogram:
+                w["right_readings"] = torch.from_numpy(w["right_readings"])
+                w["left_readings"] = torch.from_numpy(w["left_readings"])
+            data["features"].append(w)
+
+    with open(out_path, "wb") as file:
+        pickle.dump(data, file)
+
+    report_throughput(f"EMG Action Net Creation ({len(shards)} recordings)", len(data["features"]), timings,
+                      time.perf_counter() - start)
+    return data
+
+
+def emg_analysis_parallel(folder, workers=None):
+    # parallel version of dataset_creator.emg_analysis, one recording per task
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        # map returns the results in the order of folder
+        dataset_emg = [w for windows in executor.map(recording_windows, folder) for w in windows]
+
+    df_emg = pd.DataFrame(dataset_emg)
+    wall_time = time.perf_counter() - start
+    print(f"EMG Action Net Creation: {len(dataset_emg)} windows from {len(folder)} recordings in {wall_time:.1f}s "
+          f"({len(dataset_emg) / max(wall_time, 1e-9):.1f} windows/s)")
+    return df_emg
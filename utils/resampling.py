@@ -0,0 +1,66 @@
+"""
+Conversion of batches of variable-length EMG windows (time, channels) to a fixed length.
+Windows longer than the target length are downsampled with one of the following modes:
+    - strided: keeps the first i rows of every 10, with the smallest i that still gives enough rows
+      (the original dataset_creator.sampling, longer windows are truncated)
+    - linear: linear interpolation at length evenly spaced points over the whole window
+    - polyphase: scipy.signal.resample_poly, i.e. anti-aliasing filter + resampling over the whole window
+Shorter windows are padded with zero rows, whatever the mode.
+"""
+
+import numpy as np
+from scipy.signal import resample_poly
+
+MODES = ["strided", "linear", "polyphase"]
+
+
+def strided_indices(num_rows, length=750):
+    # rows kept by the strided downsampling of a window of num_rows rows
+    for i in range(2, 11):
+        value = length * (10 / i)
+        if num_rows >= value:
+            indices = (np.arange(0, int(value), 10)[:, None] + np.arange(i)[None, :]).reshape(-1)
+            return indices[indices < num_rows][:length]
+    return np.arange(min(num_rows, length))
+
+
+def resample_windows(windows, length=750, mode="strided", channels=8, dtype=np.float64):
+    """
+    windows: list of arrays (time_i, channels) with arbitrary time_i
+    returns a preallocated array (len(windows), length, channels); windows sharing the same number of rows are
+        resampled together, with a single gather (strided, linear) or a single resample_poly call (polyphase)
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown resampling mode {mode}, expected one of {MODES}")
+
+    out = np.zeros((len(windows), length, channels), dtype=dtype)
+    if len(windows) == 0:
+        return out
+
+    windows = [np.asarray(w, dtype=dtype).reshape(-1, channels) for w in windows]
+    lengths = np.array([len(w) for w in windows])
+    flat = np.concatenate(windows, axis=0)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    # short windows: copied as they are, the remaining rows stay zero (padding)
+    for num_rows in np.unique(lengths[(lengths > 0) & (lengths <= length)]):
+        rows = np.nonzero(lengths == num_rows)[0]
+        out[rows, :num_rows] = flat[offsets[rows, None] + np.arange(num_rows)[None, :]]
+
+    # long windows: downsampled to length rows
+    for num_rows in np.unique(lengths[lengths > length]):
+        rows = np.nonzero(lengths == num_rows)[0]
+        if mode == "strided":
+            out[rows] = flat[offsets[rows, None] + strided_indices(num_rows, length)[None, :]]
+        elif mode == "linear":
+            positions = np.linspace(0, num_rows - 1, length)
+            lower = np.floor(positions).astype(np.int64)
+            upper = np.minimum(lower + 1, num_rows - 1)
+            weights = (positions - lower)[None, :, None]
+            out[rows] = flat[offsets[rows, None] + lower[None, :]] * (1 - weights) + \
+                flat[offsets[rows, None] + upper[None, :]] * weights
+        else:
+            group = flat[offsets[rows, None] + np.arange(num_rows)[None, :]]
+            out[rows] = resample_poly(group, length, num_rows, axis=1)[:, :length]
+
+    return out
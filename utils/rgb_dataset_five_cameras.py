@@ -1,10 +1,10 @@
-import random
 import pickle
 import math
 import pandas as pd
 import numpy as np
 from utils.extract_pkl import *
 from sklearn.model_selection import train_test_split
+from utils.utils import make_uid
 
 
 """labels_reduced = {
@@ -50,7 +50,6 @@ labels = [
     "Unload dishwasher: 3 each large/small plates, bowls, mugs, glasses, sets of utensils",
     "Get items from cabinets: 3 each large/small plates, bowls, mugs, glasses, sets of utensils",
 ]
-uid = random.randint(0, 20000)
 dataset = []
 timestamps = []
 timestamps_int = []
@@ -66,7 +65,7 @@ def get_math_floor(float_value):
 
 def generate_record(index, row, cnt_video_split, start_frame=None, stop_frame=None):
     record = {}
-    record["uid"] = uid + index
+    record["uid"] = make_uid(f"S04_0{cnt_video_split}", index)
     record["participant_id"] = "S04"
     record["video_id"] = f"S04_0{cnt_video_split}"
     record["narration"] = row["description"]
@@ -100,7 +99,7 @@ def generate_record(index, row, cnt_video_split, start_frame=None, stop_frame=No
     return record
 
 
-def dataset_augmentation(record):
+def dataset_augmentation(record, index):
     duration = int(record["stop_timestamp"] - record["start_timestamp"])
     if duration < (offset * 2):
         return [record]
@@ -112,6 +111,8 @@ def dataset_augmentation(record):
         first_iteration = False
         new_record = record.copy()
 
+        # each camera is a different recording, so each sub-window of each camera has its own uid
+        new_record["uid"] = make_uid(record["video_id"], index, len(records))
         new_record["start_timestamp"] = new_record["start_timestamp"] + next
         new_record["stop_timestamp"] = new_record["start_timestamp"] + offset
 
@@ -132,7 +133,6 @@ def dataset_augmentation(record):
 
 def rgb_action_net_creation(out_path):
     data = get_data_from_pkl_pd("action-net/S04_1")
-    uid_offset = 0
 
     for i in range(1, 6):
         with open(f"action-net/C0{i}_timestamps.txt", "r") as file:
@@ -148,14 +148,13 @@ def rgb_action_net_creation(out_path):
         if index == 0:
             continue
 
-        record = generate_record(uid_offset, row, 1)
+        record = generate_record(index, row, 1)
         start_frame = record["start_frame"]
         stop_frame = record["stop_frame"]
 
         # Dataset augmentation by splitting video
-        records = dataset_augmentation(record)
+        records = dataset_augmentation(record, index)
         for r in records:
-            uid_offset += 1
             # Adding record(s) to dataset
             dataset.append(r)
 
@@ -163,12 +162,11 @@ def rgb_action_net_creation(out_path):
             if (row["description"].split()[0]).split("/")[0] == "Get" and k == 3:
                 continue  # avoid to append record of camera 3 for Get/Put verb where no action is performed/viewable
 
-            record = generate_record(uid_offset, row, k, start_frame, stop_frame)
+            record = generate_record(index, row, k, start_frame, stop_frame)
 
             # Dataset augmentation by splitting video
-            records = dataset_augmentation(record)
+            records = dataset_augmentation(record, index)
             for r in records:
-                uid_offset += 1
                 # Adding record(s) to dataset
                 dataset.append(r)
 
@@ -1,3 +1,4 @@
+from functools import lru_cache
 import torch
 from utils.logger import logger
 import torch
@@ -16,16 +17,21 @@ import os
 import os.path
 from utils.logger import logger
 import numpy as np
-from scipy.signal import butter, filtfilt
+from utils.emg_preprocessing import preprocess
 
 import pandas as pd
 import numpy as np
 
-import librosa
-import matplotlib.pyplot as plt
+# parameters of the spectrograms of the EMG datasets (compute_spectrogram)
+N_FFT = 32
+HOP_LENGTH = 4
 
 
 def plot_spectrogram(specgram, title=None, ylabel="freq_bin"):
+    # plotting only dependencies, not needed by the loaders importing this module
+    import librosa
+    import matplotlib.pyplot as plt
+
     fig, axs = plt.subplots(len(specgram), 1, figsize=(16, 8))
 
     axs[0].set_title(title or "Spectrogram (db)")
@@ -42,91 +48,54 @@ def plot_spectrogram(specgram, title=None, ylabel="freq_bin"):
     plt.show(block=False)
 
 
-def preprocess(readings):
-    # * apply preprocessing to the EMG data
-
-    # * Rectification
-    # abs value
-    readings_rectified = np.abs(readings)
-    # * low-pass Filter
-    # Frequenza di campionamento (Hz)
-    fs = 160  # Frequenza dei sampling data da loro
-    f_cutoff = 5  # Frequenza di taglio
-
-    # Ordine del filtro
-    order = 4
-    # Calcolo dei coefficienti del filtro
-    b, a = butter(order, f_cutoff / (fs / 2), btype="low")
-    # Concateno tutti i vettori in un'unica matrice
-    readings_filtered = np.zeros_like(readings_rectified, dtype=float)
-    for i in range(8):  # 8 colonne
-        readings_filtered[:, i] = filtfilt(b, a, readings_rectified[:, i])
-
-    # print(readings_rectified[:6], readings_rectified.shape)
-    # print(readings_filtered[:6], readings_filtered.shape)
-    # exit()
-
-    # convert to tensor
-    readings_filtered = torch.tensor(readings_filtered, dtype=torch.float32)
-
-    min_val, _ = torch.min(readings_filtered, dim=1, keepdim=True)
-    max_val, _ = torch.max(readings_filtered, dim=1, keepdim=True)
+class SpectrogramEngine(object):
+    """
+    Holds one configured torchaudio Spectrogram and applies it to whole batches of EMG windows:
+    every channel of every window goes through a single batched STFT.
+    """
+
+    def __init__(self, n_fft=32, win_length=None, hop_length=4):
+        # Sampling frequency is 160 Hz
+        # With 32 samples the frequency resolution after FFT is 160 / 32
+        self.n_fft = n_fft
+        self.win_length = win_length
+        self.hop_length = hop_length
+        self.spectrogram = T.Spectrogram(
+            n_fft=n_fft,
+            win_length=win_length,
+            hop_length=hop_length,
+            center=True,
+            pad_mode="reflect",
+            power=2.0,
+            normalized=True,
+        )
 
-    g = max_val - min_val + 0.0001
+    def __call__(self, readings):
+        """
+        readings: array or tensor (..., time, channels), e.g. (750, 8) or (N, 750, 16)
+        returns a float32 tensor (..., channels, freq_bins, frames), e.g. (8, 17, 188) or (N, 16, 17, 188)
+        """
+        readings = torch.as_tensor(readings, dtype=torch.float32)
+        # the STFT runs along the last dimension, so time goes last
+        return self.spectrogram(readings.transpose(-1, -2).contiguous())
 
-    # # Normalize the data to the range -1 to 1
-    normalized_data = 2 * (readings_filtered - min_val) / g - 1
 
-    return normalized_data
+@lru_cache(maxsize=None)
+def get_spectrogram_engine(n_fft=32, win_length=None, hop_length=4):
+    return SpectrogramEngine(n_fft=n_fft, win_length=win_length, hop_length=hop_length)
 
 
 def compute_spectrogram(readings):
-    # Sampling frequency is 160 Hz
-    # With 32 samples the frequency resolution after FFT is 160 / 32
-    n_fft = 32
-    win_length = None
-    hop_length = 4
-
-    spectrogram = T.Spectrogram(
-        n_fft=n_fft,
-        win_length=win_length,
-        hop_length=hop_length,
-        center=True,
-        pad_mode="reflect",
-        power=2.0,
-        normalized=True,
-    )
-
-    signal = [[float(x) for x in record] for record in readings]
-    signal = torch.tensor(signal, dtype=torch.float32)
-    freq_signal = torch.stack([spectrogram(readings[:, j]) for j in range(8)])
-
-    return freq_signal
+    # readings (time, channels) -> (channels, freq_bins, frames), also works on batches (N, time, channels)
+    return get_spectrogram_engine(n_fft=N_FFT, hop_length=HOP_LENGTH)(readings)
 
 
 def compute_spectrogram_alt(readings):
-    # Sampling frequency is 160 Hz
-    # With 32 samples the frequency resolution after FFT is 160 / 32
-    n_fft = 32
-    win_length = None
-    hop_length = 4
-
-    spectrogram = T.Spectrogram(
-        n_fft=n_fft,
-        win_length=win_length,
-        hop_length=hop_length,
-        center=True,
-        pad_mode="reflect",
-        power=2.0,
-        normalized=True,
-    )
+    spectrogram = get_spectrogram_engine()
 
     for i in range(len(readings)):
-        signal_l = (readings[i]["left_readings"]).float()
-        signal_r = (readings[i]["right_readings"]).float()
-
-        freq_signal_l = [spectrogram(signal_l[:, j]) for j in range(8)]
-        freq_signal_r = [spectrogram(signal_r[:, j]) for j in range(8)]
+        freq_signal_l = spectrogram(readings[i]["left_readings"])
+        freq_signal_r = spectrogram(readings[i]["right_readings"])
 
-        readings[i]["left_readings"] = freq_signal_l
-        readings[i]["right_readings"] = freq_signal_r
+        readings[i]["left_readings"] = list(freq_signal_l)
+        readings[i]["right_readings"] = list(freq_signal_r)
@@ -1,4 +1,5 @@
 import torchvision
+import torchvision.transforms.functional as TF
 import random
 from PIL import Image, ImageOps
 import numpy as np
@@ -76,8 +77,27 @@ class GroupNormalize(object):
             tensor = (tensor - tensor.min()) / (tensor.max() - tensor.min()) * \
                      (self.range[1] - self.range[0]) + self.range[0]
 
-            for t, m, s in zip(tensor, rep_mean, rep_std):
-                t.sub_(m).div_(s)
+            # all the channels at once, (C, 1, 1) mean and std broadcast over (C, H, W)
+            n = min(tensor.size(0), len(rep_mean), len(rep_std))
+            shape = (n,) + (1,) * (tensor.dim() - 1)
+            tensor[:n].sub_(torch.tensor(rep_mean[:n], dtype=tensor.dtype).view(shape)) \
+                .div_(torch.tensor(rep_std[:n], dtype=tensor.dtype).view(shape))
+        return tensor
+
+    def normalize_batch(self, tensor):
+        # same as __call__ on each (C, H, W) sample of a batch (B, C, H, W), in one op
+        if self.normalize:
+            rep_mean = self.mean * (tensor.size()[1] // len(self.mean))
+            rep_std = self.std * (tensor.size()[1] // len(self.std))
+            dims = tuple(range(1, tensor.dim()))
+            t_min = tensor.amin(dim=dims, keepdim=True)
+            t_max = tensor.amax(dim=dims, keepdim=True)
+            tensor = (tensor - t_min) / (t_max - t_min) * (self.range[1] - self.range[0]) + self.range[0]
+
+            n = min(tensor.size(1), len(rep_mean), len(rep_std))
+            shape = (1, n) + (1,) * (tensor.dim() - 2)
+            tensor[:, :n].sub_(torch.tensor(rep_mean[:n], dtype=tensor.dtype).view(shape)) \
+                .div_(torch.tensor(rep_std[:n], dtype=tensor.dtype).view(shape))
         return tensor
 
 
@@ -285,7 +305,10 @@ class ToTorchFormatTensor(object):
         self.div = div
 
     def __call__(self, pic):
-        if isinstance(pic, np.ndarray):
+        if isinstance(pic, torch.Tensor):
+            # stacked clip tensor (H x W x C), see ClipStack
+            img = pic.permute(2, 0, 1).contiguous()
+        elif isinstance(pic, np.ndarray):
             # handle numpy array
             # put it from HWC to CHW format
             img = torch.from_numpy(pic).permute(2, 0, 1).contiguous()
@@ -302,6 +325,147 @@ class ToTorchFormatTensor(object):
         return img
 
 
+# Clip transforms: tensor-native versions of the Group transforms. A clip is an uint8 tensor (T, H, W, C) with all
+# the frames of a sample, each transform processes the whole clip with one vectorized op and samples its random
+# parameters exactly like the corresponding Group transform (same calls to random, in the same order).
+
+
+def _resize_clip(clip, size):
+    # (T, H, W, C) -> (T, size[0], size[1], C), bilinear with antialiasing like PIL.Image.resize
+    clip = TF.resize(clip.permute(0, 3, 1, 2), list(size), interpolation=TF.InterpolationMode.BILINEAR,
+                     antialias=True)
+    return clip.permute(0, 2, 3, 1)
+
+
+class ClipFromGroup(object):
+    """
+    Converts a list of PIL.Image (RGB) or uint8 tensors (H, W, C) of the same size into an uint8 clip tensor (T, H, W, C)
+    """
+
+    def __call__(self, img_group):
+        if torch.is_tensor(img_group[0]):
+            return torch.stack(img_group)
+        return torch.from_numpy(np.stack([np.asarray(img) for img in img_group]))
+
+
+class ClipScale(object):
+    """
+    Clip version of GroupScale: rescales the clip so that its smaller edge is 'size'
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+    def __call__(self, clip):
+        clip = TF.resize(clip.permute(0, 3, 1, 2), self.size, interpolation=TF.InterpolationMode.BILINEAR,
+                         antialias=True)
+        return clip.permute(0, 2, 3, 1)
+
+
+class ClipCenterCrop(object):
+    """
+    Clip version of GroupCenterCrop
+    """
+
+    def __init__(self, size):
+        self.size = size if not isinstance(size, numbers.Number) else (int(size), int(size))
+
+    def __call__(self, clip):
+        return TF.center_crop(clip.permute(0, 3, 1, 2), list(self.size)).permute(0, 2, 3, 1)
+
+
+class ClipMultiScaleCrop(GroupMultiScaleCrop):
+    """
+    Clip version of GroupMultiScaleCrop, same crop sizes and offsets
+    """
+
+    def __call__(self, clip):
+        im_size = (clip.size(2), clip.size(1))
+
+        crop_w, crop_h, offset_w, offset_h = self._sample_crop_size(im_size)
+        # PIL.Image.crop rounds the box to integer coordinates
+        offset_w, offset_h = int(round(offset_w)), int(round(offset_h))
+        crop = clip[:, offset_h:offset_h + crop_h, offset_w:offset_w + crop_w]
+        return _resize_clip(crop, (self.input_size[1], self.input_size[0]))
+
+
+class ClipRandomHorizontalFlip(GroupRandomHorizontalFlip):
+    """
+    Clip version of GroupRandomHorizontalFlip
+    """
+
+    def __call__(self, clip, is_flow=False):
+        v = random.random()
+        if v < 0.5:
+            clip = clip.flip(2)
+            if self.is_flow:
+                clip = clip.clone()
+                clip[0::2] = 255 - clip[0::2]  # invert flow pixel values when flipping
+        return clip
+
+
+class ClipStack(object):
+    """
+    Clip version of Stack: (T, H, W, C) -> uint8 tensor (H, W, T * C), frames concatenated along the channels
+    """
+
+    def __init__(self, roll=False):
+        self.roll = roll
+
+    def __call__(self, clip):
+        if self.roll:
+            clip = clip.flip(3)
+        t, h, w, c = clip.shape
+        return clip.permute(1, 2, 0, 3).reshape(h, w, t * c)
+
+
+class ClipBatchTransform(object):
+    """
+    Applies a clip pipeline (the transforms following ClipFromGroup) to a batch of uint8 clips (B, T, H, W, C), e.g. in
+    the main process on the raw clips returned by the DataLoader workers.
+    The random transforms (crop, flip) run clip by clip, with the same random parameters the per-sample pipeline
+    would draw for each sample; the deterministic ones run once on the whole batch.
+    returns the outputs of the per-sample pipeline stacked along the batch, (B, T * C, H, W)
+    """
+
+    RANDOM = (ClipMultiScaleCrop, ClipRandomHorizontalFlip)
+
+    def __init__(self, transforms):
+        self.transforms = list(transforms)
+
+    def __call__(self, clips):
+        i = 0
+        while i < len(self.transforms):
+            t = self.transforms[i]
+            if isinstance(t, self.RANDOM):
+                # consecutive random transforms are applied to a clip before moving to the next one
+                j = i
+                while j < len(self.transforms) and isinstance(self.transforms[j], self.RANDOM):
+                    j += 1
+                clips = torch.stack([torchvision.transforms.Compose(self.transforms[i:j])(clip) for clip in clips])
+                i = j
+                continue
+
+            if isinstance(t, (ClipCenterCrop, ClipScale)):
+                # the frames of all the clips at once
+                b, n = clips.shape[:2]
+                clips = t(clips.reshape(b * n, *clips.shape[2:]))
+                clips = clips.reshape(b, n, *clips.shape[1:])
+            elif isinstance(t, ClipStack):
+                if t.roll:
+                    clips = clips.flip(-1)
+                b, n, h, w, c = clips.shape
+                clips = clips.permute(0, 1, 4, 2, 3).reshape(b, n * c, h, w)
+            elif isinstance(t, ToTorchFormatTensor):
+                clips = (clips.to(torch.float32).div(255) - 0.5) * 2 if t.div else clips.to(torch.float32)
+            elif isinstance(t, GroupNormalize):
+                clips = t.normalize_batch(clips)
+            else:
+                raise ValueError(f"{type(t).__name__} cannot be applied to a batch of clips")
+            i += 1
+        return clips
+
+
 class IdentityTransform(object):
 
     def __call__(self, data):
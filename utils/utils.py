@@ -1,4 +1,6 @@
 from collections.abc import Mapping
+import hashlib
+import os
 import torch
 
 
@@ -11,6 +13,22 @@ def get_domains_and_labels(args):
     num_class = num_verbs
     return num_class, valid_labels, source_domain, target_domain
 
+def recording_name(path):
+    # "action-net/pickles/S04_1.pkl" -> "S04_1"
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def make_uid(recording, activity, sub_window=0):
+    """
+    Content-addressed uid of a sample: the same recording, activity (row index in the recording) and sub-window
+    (index of the window produced by dataset_augmentation) always get the same uid, whatever the build order,
+    the split or the process that builds it, so saved features and caches keyed by uid stay valid across rebuilds.
+    returns a non-negative int that fits in an int64
+    """
+    key = f"{recording}/{int(activity)}/{int(sub_window)}".encode()
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big") >> 1
+
+
 class Accuracy(object):
     """Computes and stores the average and current value of different top-k accuracies from the outputs and labels"""
 